@@ -9,6 +9,8 @@ import itertools
 import time
 from profilehooks import profile
 
+from surrounding import surrounding_table
+
 SERVER_ADDR = "http://localhost:1066"
 
 # Ghetto enums for cell value; non-neg values are surround count for cleared
@@ -186,6 +188,7 @@ class Game:
 	turns_hash_sum = 0
 	start_time = None
 	wait_time = None
+	surr_table = None
 	surr_coords_lookup = None
 
 	def __init__(self, dims=None, mines=None, reload_id=None):
@@ -211,6 +214,7 @@ class Game:
 
 		self.game_grid = numpy.ndarray(self.dims, dtype=int)
 		self.game_grid.fill(UNKNOWN)
+		self.surr_table = surrounding_table(self.dims)
 		self.surr_coords_lookup = {}
 
 		print("New game: {} (original {}) dims: {} mines: {}".format(
@@ -276,23 +280,14 @@ class Game:
 		if self.game_over:
 			raise GameEnd(self)
 
-	# Iterator for co-ordinate tuples of all cells in contact with a given cell.
+	# Co-ordinate tuples of all cells in contact with a given cell. Memoised
+	# per game, as the table may be shared with other games.
 	def get_surrounding(self, coords):
+		coords = tuple(coords)
 		if not coords in self.surr_coords_lookup:
-			self.surr_coords_lookup[coords] = []
-
-			for shift in itertools.product(*([-1, 0, 1],) * len(coords)):
-				surr_coords = tuple(sum(c) for c in zip(shift, coords))
-
-				# Check all coords are positive
-				if any(c < 0 for c in surr_coords):
-					continue
-
-				# Check all coords are within grid size
-				if any(c >= d for c, d in zip(surr_coords, self.dims)):
-					continue
-
-				self.surr_coords_lookup[coords].append(surr_coords)
+			self.surr_coords_lookup[coords] = (
+				self.surr_table.surrounding_coords(coords)
+			)
 
 		return self.surr_coords_lookup[coords]
 
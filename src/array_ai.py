@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+import time
+import math
+import random
+import functools
+import numpy
+
+from reactive_ai import (
+	State,
+	DebugLevel,
+	GameEnd,
+	check_full_board_size,
+	log,
+	server_cell_states,
+	server_cell_state_codes
+)
+from surrounding import surrounding_table, shared_surrounding_columns
+
+# Same deductions as ReactiveClient, but with the client's view of the grid kept
+# in flat typed arrays indexed by flat cell index (as given by
+# numpy.ravel_multi_index), instead of a dict of Cell objects.
+
+# Whether each state code of batched turn results is a cleared cell
+server_state_code_cleared = numpy.array(
+	[s == State.EMPTY for s in server_cell_state_codes]
+)
+
+class ArrayGameGrid(object):
+	dims = None
+	size = None
+	check_shared = False
+
+	# Indexed by flat cell index, with one extra entry at the end as the target
+	# of out-of-grid entries in surr_index. The extra entry is given a state
+	# which is never matched or updated.
+	state = None
+	unkn_surr_mine_cnt = None
+	unkn_surr_empt_cnt = None
+
+	surr_index = None
+
+	# Flat indices of cells changed since last collected by cells_debug; a list
+	# of arrays. Only tracked if set to a list.
+	debug_changed = None
+
+	def __init__(self, dims, check_shared=False):
+		self.dims = tuple(dims)
+		self.size = functools.reduce(lambda x,y: x*y, self.dims)
+		self.check_shared = check_shared
+
+		self.surr_index = surrounding_table(self.dims).padded
+
+		self.state = numpy.full(self.size + 1, State.UNKNOWN.value, numpy.int8)
+		self.state[self.size] = State.MINE.value
+
+		self.unkn_surr_mine_cnt = numpy.zeros(self.size + 1, numpy.int16)
+		self.unkn_surr_empt_cnt = numpy.zeros(self.size + 1, numpy.int16)
+		self.unkn_surr_empt_cnt[:self.size] = numpy.count_nonzero(
+			self.surr_index < self.size,
+			axis=1
+		)
+
+		if check_shared:
+			self.shared_columns = shared_surrounding_columns(len(self.dims))
+
+	# Cells whose state is unknown to the server: UNKNOWN and TO_CLEAR (which
+	# are still counted as unknown empties by their surrounding cells).
+	def unknown(self, index):
+		state = self.state[index]
+		return (state == State.UNKNOWN.value) | (state == State.TO_CLEAR.value)
+
+	def set_state(self, index, state):
+		self.state[index] = state.value
+		if self.debug_changed is not None:
+			self.debug_changed.append(index)
+
+	def add_surr_counts(self, counts, index, val):
+		surr_index = self.surr_index[index].ravel()
+		numpy.add.at(counts, surr_index, val)
+		if self.debug_changed is not None:
+			self.debug_changed.append(surr_index)
+
+	# Apply newly cleared cells from the server, then make all possible
+	# deductions. Returns the flat indices of cells newly set to TO_CLEAR, and
+	# of cells newly set to MINE.
+	def update(self, index, surr_mine_counts):
+		not_known = self.state[index] != State.EMPTY.value
+		index = index[not_known]
+		surr_mine_counts = surr_mine_counts[not_known]
+
+		self.set_state(index, State.EMPTY)
+		self.unkn_surr_mine_cnt[index] += surr_mine_counts
+		self.unkn_surr_empt_cnt[index] -= surr_mine_counts
+		self.add_surr_counts(self.unkn_surr_empt_cnt, index, -1)
+
+		new_to_clear = []
+		new_mines = []
+		changed = index
+
+		while len(changed) > 0:
+			to_clear, mines = self.deduce(changed)
+
+			self.set_state(to_clear, State.TO_CLEAR)
+			self.set_state(mines, State.MINE)
+			self.add_surr_counts(self.unkn_surr_mine_cnt, mines, -1)
+
+			new_to_clear.append(to_clear)
+			new_mines.append(mines)
+
+			# Only new mines affect any other cell's counts
+			changed = mines
+
+		return numpy.concatenate(new_to_clear), numpy.concatenate(new_mines)
+
+	# Find UNKNOWN cells which can be cleared or flagged, from cleared cells
+	# which are, or surround, the changed cells.
+	def deduce(self, changed):
+		candidates = numpy.unique(numpy.concatenate(
+			(changed, self.surr_index[changed].ravel())
+		))
+		candidates = candidates[
+			self.state[candidates] == State.EMPTY.value
+		]
+
+		cand_surr = self.surr_index[candidates]
+		cand_surr_unknown = self.state[cand_surr] == State.UNKNOWN.value
+
+		to_clear = [cand_surr[
+			cand_surr_unknown &
+			(self.unkn_surr_mine_cnt[candidates] == 0)[:, numpy.newaxis]
+		]]
+		mines = [cand_surr[
+			cand_surr_unknown &
+			(self.unkn_surr_empt_cnt[candidates] == 0)[:, numpy.newaxis]
+		]]
+
+		if self.check_shared:
+			self.deduce_shared(candidates, to_clear, mines)
+
+		mines = numpy.unique(numpy.concatenate(mines))
+		to_clear = numpy.setdiff1d(numpy.concatenate(to_clear), mines)
+		return to_clear, mines
+
+	# Equivalent to ReactiveClient.check_shared_pairs, for each candidate
+	# cell paired with every cleared cell it shares surrounding cells with.
+	def deduce_shared(self, candidates, to_clear, mines):
+		coords = numpy.array(numpy.unravel_index(candidates, self.dims))
+		dims = numpy.array(self.dims)[:, numpy.newaxis]
+
+		for delta, shared, a_only, b_only in self.shared_columns:
+			other_coords = coords + delta[:, numpy.newaxis]
+			valid = ((other_coords >= 0) & (other_coords < dims)).all(axis=0)
+			a = candidates[valid]
+			b = numpy.ravel_multi_index(other_coords[:, valid], self.dims)
+
+			both_empty = self.state[b] == State.EMPTY.value
+			a = a[both_empty]
+			b = b[both_empty]
+
+			a_surr = self.surr_index[a]
+			b_surr = self.surr_index[b]
+			mutual_count = numpy.count_nonzero(
+				self.unknown(a_surr[:, shared]),
+				axis=1
+			)
+
+			for (cell1, cell2, cell1_only, cell2_only) in (
+				(a, b, a_surr[:, a_only], b_surr[:, b_only]),
+				(b, a, b_surr[:, b_only], a_surr[:, a_only])
+			):
+				saturated = (
+					self.unkn_surr_mine_cnt[cell1] +
+					self.unkn_surr_empt_cnt[cell2] <= mutual_count
+				)[:, numpy.newaxis]
+
+				to_clear.append(cell1_only[
+					saturated &
+					(self.state[cell1_only] == State.UNKNOWN.value)
+				])
+				mines.append(cell2_only[
+					saturated &
+					(self.state[cell2_only] == State.UNKNOWN.value)
+				])
+
+	# Debug information about each cell whose state or counts have changed
+	# since the game started, or only since the last call if tracking changes;
+	# so applying each set of changes in turn gives the same cells as the
+	# whole. Matches the format of ReactiveClient.game_cells_debug where
+	# possible.
+	def cells_debug(self):
+		if self.debug_changed is None:
+			surr_count = numpy.count_nonzero(
+				self.surr_index[:self.size] < self.size,
+				axis=1
+			)
+			index = (
+				(self.state[:self.size] != State.UNKNOWN.value) |
+				(self.unkn_surr_mine_cnt[:self.size] != 0) |
+				(self.unkn_surr_empt_cnt[:self.size] != surr_count)
+			).nonzero()[0]
+		else:
+			index = numpy.unique(numpy.concatenate(
+				[numpy.empty(0, dtype=numpy.intp)] + self.debug_changed
+			))
+			index = index[index < self.size]
+			self.debug_changed = []
+
+		return {
+			",".join(str(c) for c in coords) : {
+				"coords" : coords,
+				"_state" : State(state),
+				"_unkn_surr_mine_cnt" : mine_cnt,
+				"_unkn_surr_empt_cnt" : empt_cnt
+			}
+			for coords, state, mine_cnt, empt_cnt in zip(
+				zip(*(c.tolist() for c in numpy.unravel_index(
+					index,
+					self.dims
+				))),
+				self.state[index].tolist(),
+				self.unkn_surr_mine_cnt[index].tolist(),
+				self.unkn_surr_empt_cnt[index].tolist()
+			)
+		}
+
+class ArrayReactiveClient(object):
+	# Set True for more advanced logic.
+	check_shared = False
+	game_grid = None
+	game_over = False
+	win = False
+	turns_hash_sum = 0
+	# Number of turns which cleared a guessed cell
+	guesses = 0
+	start_time = None
+	wait_time = None
+
+	# Whether the server has the batched array turn API
+	server_turn_array = False
+
+	# Sent as ALL to servers which don't take changes only
+	debug_level = DebugLevel.CHANGED
+
+	# Whether to send debug info at all; only if the server uses it.
+	send_debug = False
+
+	# Flat indices of cells waiting to be cleared, of all flagged mines and of
+	# mines flagged since the last turn; lists of arrays, concatenated when
+	# needed.
+	to_clear = None
+	flagged = None
+	new_flags = None
+
+	def __init__(self, server, first_coords=None):
+		self.server = server
+		self.server_turn_array = hasattr(server, "turn_array")
+		self.wait_time = float(0)
+
+		check_full_board_size(self, self.server.dims)
+		self.game_grid = ArrayGameGrid(self.server.dims, self.check_shared)
+
+		self.send_debug = (
+			self.server.consumes_debug and
+			self.debug_level != DebugLevel.NONE
+		)
+		if (
+			self.debug_level == DebugLevel.CHANGED and
+			not self.server.debug_changes_only
+		):
+			self.debug_level = DebugLevel.ALL
+		if self.send_debug and self.debug_level == DebugLevel.CHANGED:
+			self.game_grid.debug_changed = []
+		self.to_clear = []
+		self.flagged = [numpy.empty(0, dtype=numpy.intp)]
+		self.new_flags = [numpy.empty(0, dtype=numpy.intp)]
+
+		log(3, "New game: {} (original {}) dims: {} mines: {}".format(
+			self.server.id,
+			self.server.reload_id or self.server.id,
+			self.server.dims,
+			self.server.mines
+		))
+
+		try:
+			self.play(first_coords)
+		except GameEnd as e:
+			pass
+
+	def random_coords(self):
+		return tuple(
+			math.floor(random.random() * dim) for dim in self.server.dims
+		)
+
+	def play(self, first_coords):
+		self.start_time = time.time()
+		if first_coords == None:
+			first_coords = self.random_coords()
+
+		if first_coords == 0:
+			first_coords = (0,) * len(self.server.dims)
+
+		log(3, "Clearing... ", end='', flush=True)
+		self.set_to_clear(numpy.array(
+			[numpy.ravel_multi_index(first_coords, self.game_grid.dims)]
+		))
+		while True:
+			self.turn()
+
+	def set_to_clear(self, index):
+		self.game_grid.set_state(index, State.TO_CLEAR)
+		self.to_clear.append(index)
+
+	def turn(self):
+		if not any(len(index) for index in self.to_clear):
+			guess_index = self.get_guess_index()
+
+			if guess_index is None:
+				raise GameEnd(self, "Out of ideas!")
+
+			log(2, "(?)", end='', flush=True)
+			self.guesses += 1
+			self.set_to_clear(numpy.array([guess_index]))
+
+		to_clear = numpy.concatenate(self.to_clear)
+		self.to_clear = []
+
+		to_flag = numpy.concatenate(
+			self.new_flags if self.server.flags_incremental else self.flagged
+		)
+		self.new_flags = [numpy.empty(0, dtype=numpy.intp)]
+
+		log(2, "{}".format(len(to_clear)), end='', flush=True)
+
+		self.turns_hash_sum += hash(to_clear.tobytes())
+
+		to_clear_coords, to_flag_coords = (
+			numpy.stack(
+				numpy.unravel_index(index, self.game_grid.dims),
+				axis=-1
+			)
+			for index in (to_clear, to_flag)
+		)
+
+		turn_args = { "client" : self.__class__.__name__ }
+		if self.send_debug:
+			turn_args["debug"] = {
+				"gameInfo" : "game info here",
+				"cellInfo" : self.game_grid.cells_debug(),
+				"cellInfoChangesOnly" : self.debug_level == DebugLevel.CHANGED
+			}
+
+		wait_start = time.time()
+		if self.server_turn_array:
+			new_cells = self.server.turn_array(
+				to_clear_coords,
+				to_flag_coords,
+				**turn_args
+			)
+		else:
+			new_cells = self.server.turn(
+				clear=[tuple(c) for c in to_clear_coords.tolist()],
+				flag=[tuple(c) for c in to_flag_coords.tolist()],
+				**turn_args
+			)
+		self.wait_time += time.time() - wait_start
+
+		log(2, "->{} ".format(len(new_cells)), end='', flush=True)
+
+		if self.server.game_over:
+			raise GameEnd(self)
+
+		if self.server_turn_array:
+			index = new_cells["index"]
+			surr_mine_counts = new_cells["surrounding"]
+			cleared = server_state_code_cleared[new_cells["state"]]
+		else:
+			index = numpy.ravel_multi_index(
+				numpy.array(
+					[c["coords"] for c in new_cells],
+					dtype=numpy.intp
+				).reshape(len(new_cells), len(self.game_grid.dims)).T,
+				self.game_grid.dims
+			)
+			surr_mine_counts = numpy.array(
+				[c["surrounding"] for c in new_cells],
+				dtype=numpy.int16
+			)
+			cleared = numpy.array(
+				[
+					server_cell_states[c["state"]] == State.EMPTY
+					for c in new_cells
+				],
+				dtype=bool
+			)
+
+		# Servers only return cleared cells in practice
+		new_to_clear, new_mines = self.game_grid.update(
+			index[cleared],
+			surr_mine_counts[cleared]
+		)
+
+		self.set_to_clear(new_to_clear)
+		self.flagged.append(new_mines)
+		self.new_flags.append(new_mines)
+
+	# Flat index of a cell to guess when there's nothing left to clear, or None
+	def get_guess_index(self):
+		pass
+
+class ArrayReactiveClientCheckShared(ArrayReactiveClient):
+	check_shared = True
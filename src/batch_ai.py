@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+import time
+import numpy
+
+from internal_server import MINE, random_grids
+
+# Plays many games of ReactiveClient's deductions at once, with every board
+# stacked into one array; the server and client are both just array operations
+# over all the boards. Each round, every revealed cell whose surrounding mines
+# are all flagged has its unknown surrounding cells cleared, and every revealed
+# cell with as many unknown surrounding cells as unflagged mines has them
+# flagged, until no board changes. As ReactiveClient never guesses and makes no
+# wrong deductions, this reaches the same cells as it does (in fewer, larger
+# turns), so each game is won or lost the same way.
+#
+# Each board is kept with a border of empty cells around it, and the whole
+# batch flattened into one row of cells. A cell's neighbours along each axis
+# are then just a fixed distance either side of it in the row, whichever board
+# it's in, so surrounding counts are a few shifted sums over the whole row.
+
+# Shape of a board with its border, the distance along the row between
+# neighbours on each axis, and which of its cells are on the board itself
+def padded_layout(dims):
+	shape = tuple(d + 2 for d in dims)
+	strides = tuple(
+		int(numpy.prod(shape[axis + 1:], dtype=int))
+		for axis in range(len(shape))
+	)
+	inside = numpy.zeros(shape, dtype=bool)
+	inside[tuple(slice(1, -1) for _ in dims)] = True
+	return shape, strides, inside.ravel()
+
+# Sum of each cell's surrounding values, for every board of a (games, cells)
+# array of bordered boards at once, in the given type. The sum over each
+# 3x3(x...) box is taken one axis at a time, then the cell's own value is taken
+# off. Sums spill over into the border cells (and wrap from one row of a board
+# into the border of the next), but never into the board itself, so the border
+# cells' counts are meaningless.
+def surrounding_counts(arr, strides, dtype=numpy.uint8):
+	values = arr.astype(dtype).ravel()
+	counts = values
+
+	for stride in strides:
+		box_counts = counts.copy()
+		box_counts[stride:] += counts[:-stride]
+		box_counts[:-stride] += counts[stride:]
+		counts = box_counts
+
+	counts -= values
+	return counts.reshape(arr.shape)
+
+# Surrounding counts of two boolean arrays at once, packed into one integer
+# array as count_a | count_b << shift; see packed_count_bits
+def packed_surrounding_counts(a, b, strides, shift, dtype):
+	return surrounding_counts(
+		a.astype(dtype) | (b.astype(dtype) << dtype(shift)),
+		strides,
+		dtype
+	)
+
+# Number of bits which fit any count of surrounding cells, and an unsigned type
+# which fits two counts packed with it
+def packed_count_bits(num_dims):
+	shift = (3 ** num_dims - 1).bit_length()
+
+	for dtype in numpy.uint8, numpy.uint16, numpy.uint32, numpy.uint64:
+		if 2 * shift <= numpy.iinfo(dtype).bits:
+			return shift, dtype
+
+class BatchReactiveGames(object):
+	dims = None
+	games = None
+
+	# Each (games, *dims), once played
+	mines = None
+	revealed = None
+	flagged = None
+
+	# Per game, once played
+	win = None
+	cells_rem = None
+
+	# Rounds of deductions until every board stopped changing
+	rounds = 0
+	total_time = None
+
+	# grids as for PythonInternalServer, stacked into one (games, *dims)
+	# array. first_coords is where each game starts; the first cell by
+	# default (as for first_coords=0 in ReactiveClient).
+	def __init__(self, grids, first_coords=None):
+		start_time = time.time()
+
+		grids = numpy.asarray(grids)
+		self.games = grids.shape[0]
+		self.dims = grids.shape[1:]
+
+		if first_coords is None:
+			first_coords = (0,) * len(self.dims)
+		self.play(grids == MINE, tuple(first_coords))
+
+		self.total_time = time.time() - start_time
+
+	def play(self, mines, first_coords):
+		shape, strides, inside = padded_layout(self.dims)
+		board = (slice(None),) + tuple(slice(1, -1) for _ in self.dims)
+		shift, dtype = packed_count_bits(len(self.dims))
+		mask = dtype((1 << shift) - 1)
+
+		padded_mines = numpy.zeros((self.games,) + shape, dtype=bool)
+		padded_mines[board] = mines
+		padded_mines = padded_mines.reshape(self.games, -1)
+		surr_mine_counts = surrounding_counts(padded_mines, strides, dtype)
+
+		revealed = numpy.zeros_like(padded_mines)
+		flagged = numpy.zeros_like(padded_mines)
+
+		# Games which start on a mine are lost straight away
+		first = sum((c + 1) * s for c, s in zip(first_coords, strides))
+		revealed[:, first] = ~padded_mines[:, first]
+		active = numpy.flatnonzero(revealed[:, first])
+
+		while active.size:
+			self.rounds += 1
+
+			# Every game is still going for the first few rounds, so there's
+			# no need to pick them out
+			if active.size == self.games:
+				active_revealed = revealed
+				active_flagged = flagged
+				counts = surr_mine_counts
+			else:
+				active_revealed = revealed[active]
+				active_flagged = flagged[active]
+				counts = surr_mine_counts[active]
+			unknown = inside & ~(active_revealed | active_flagged)
+
+			surr_counts = packed_surrounding_counts(
+				active_flagged,
+				unknown,
+				strides,
+				shift,
+				dtype
+			)
+			surr_flagged = surr_counts & mask
+			clear_around = active_revealed & (counts == surr_flagged)
+			flag_around = active_revealed & (
+				counts == surr_flagged + (surr_counts >> dtype(shift))
+			)
+
+			surr_counts = packed_surrounding_counts(
+				clear_around,
+				flag_around,
+				strides,
+				shift,
+				dtype
+			)
+			to_clear = unknown & (surr_counts & mask > 0)
+			to_flag = unknown & (surr_counts > mask)
+			changed = (to_clear | to_flag).any(axis=1)
+
+			if active.size == self.games:
+				revealed |= to_clear
+				flagged |= to_flag
+			else:
+				revealed[active] = active_revealed | to_clear
+				flagged[active] = active_flagged | to_flag
+			active = active[changed]
+
+		self.mines = mines
+		self.revealed = revealed.reshape((self.games,) + shape)[board]
+		self.flagged = flagged.reshape((self.games,) + shape)[board]
+
+		empty_cells = (~mines).reshape(self.games, -1).sum(axis=1)
+		self.cells_rem = empty_cells - revealed.sum(axis=1)
+		self.win = self.cells_rem == 0
+
+# Play a game of each seed, with boards as PythonInternalServer would make
+def play_seeds(dims, mines, seeds, first_coords=None):
+	return BatchReactiveGames(random_grids(dims, mines, seeds), first_coords)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+# Show the time and memory taken to generate a board, and to set up a server
+# with it (which also counts every cell's surrounding mines), up to the
+# 10000x10000 boards of dbtest.py.
+
+import time
+import tracemalloc
+import numpy
+
+from internal_server import random_grid, PythonInternalServer
+
+def measure(func, *args):
+	tracemalloc.start()
+	start_time = time.time()
+	func(*args)
+	elapsed = time.time() - start_time
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return elapsed, peak
+
+def test(dims, mines, seed):
+	grid_time, grid_peak = measure(random_grid, dims, mines, seed)
+	server_time, server_peak = measure(PythonInternalServer, dims, mines, seed)
+
+	print("{:>12}{:>10} mines{:>10.3f}s{:>10.1f}MB peak grid"
+		"{:>10.3f}s{:>10.1f}MB peak server".format(
+		"x".join(str(d) for d in dims),
+		mines,
+		grid_time,
+		grid_peak / 2 ** 20,
+		server_time,
+		server_peak / 2 ** 20
+	))
+
+for dims in (100, 100), (1000, 1000), (10000, 10000):
+	for mines in 200, int(0.01 * numpy.prod(dims)), int(0.2 * numpy.prod(dims)):
+		test(dims, mines, 1)
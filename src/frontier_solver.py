@@ -0,0 +1,572 @@
+#!/usr/bin/env python3
+import math
+import operator
+import time
+import numpy
+
+# Exact mine probabilities for the unknown cells of a game, given the cleared
+# cells' counts. Each constraint is a pair of (unknown cells, number of mines
+# among them); cells can be any hashable, sortable values. Cells not in any
+# constraint ("interior" cells) are only counted, since any arrangement of the
+# remaining mines among them is equally likely.
+
+# Raised when a search runs out of steps or time, with the number of steps it
+# took
+class SolverLimit(Exception):
+	def __init__(self, steps=None):
+		super().__init__(steps)
+		self.steps = steps
+
+# Number of search steps between checks of a StepBudget's deadline
+DEADLINE_CHECK_STEPS = 64
+
+# A number of search steps shared by several searches, such as those for every
+# component of one guess; each search takes the steps it uses from it. Searches
+# also stop at the deadline (a time.time() value), if given.
+class StepBudget(object):
+	def __init__(self, steps=None, deadline=None):
+		self.steps_left = steps
+		self.deadline = deadline
+
+# Split constrained cells into groups which don't share any constraints, using
+# union-find. Returns a list of (cells, constraints) pairs; cells are sorted,
+# and constraints are in their original order.
+def split_components(constraints):
+	parent = {}
+
+	def find(cell):
+		root = cell
+		while parent[root] != root:
+			root = parent[root]
+		# Path compression
+		while parent[cell] != root:
+			parent[cell], cell = root, parent[cell]
+		return root
+
+	for cells, _ in constraints:
+		for cell in cells:
+			parent.setdefault(cell, cell)
+		root = find(cells[0])
+		for cell in cells[1:]:
+			other_root = find(cell)
+			if other_root != root:
+				parent[other_root] = root
+
+	components = {}
+	for cell in sorted(parent):
+		components.setdefault(find(cell), ([], []))[0].append(cell)
+	for constraint in constraints:
+		components[find(constraint[0][0])][1].append(constraint)
+
+	return list(components.values())
+
+# Enumerate every arrangement of mines in one component which satisfies its
+# constraints, by backtracking; forced cells are set as soon as a constraint is
+# full or has no room left. Returns the number of solutions with each number
+# of mines k, and for each cell, the number of those solutions in which it's a
+# mine. Raises SolverLimit if the search needs more steps than are left in the
+# given StepBudget.
+def count_component_solutions(cells, constraints, budget=None):
+	var_index = { cell : i for i, cell in enumerate(cells) }
+	cons_vars = [[var_index[c] for c in cs] for cs, _ in constraints]
+	cons_target = [mines for _, mines in constraints]
+	var_cons = [[] for _ in cells]
+	for ci, vs in enumerate(cons_vars):
+		for v in vs:
+			var_cons[v].append(ci)
+
+	counts = [0] * (len(cells) + 1)
+	tallies = { cell : [0] * (len(cells) + 1) for cell in cells }
+
+	assignment = [None] * len(cells)
+	cons_mines = [0] * len(constraints)
+	cons_unassigned = [len(vs) for vs in cons_vars]
+	trail = []
+
+	def assign(v, val):
+		assignment[v] = val
+		trail.append(v)
+		for ci in var_cons[v]:
+			cons_mines[ci] += val
+			cons_unassigned[ci] -= 1
+
+	def undo(trail_len):
+		while len(trail) > trail_len:
+			v = trail.pop()
+			for ci in var_cons[v]:
+				cons_mines[ci] -= assignment[v]
+				cons_unassigned[ci] += 1
+			assignment[v] = None
+
+	# Check and apply forced cells for the given constraints, and any
+	# constraints affected in turn. Returns False on a contradiction.
+	def propagate(cons_queue):
+		while cons_queue:
+			ci = cons_queue.pop()
+			mines, unassigned = cons_mines[ci], cons_unassigned[ci]
+			target = cons_target[ci]
+
+			if mines > target or mines + unassigned < target:
+				return False
+			if unassigned == 0:
+				continue
+
+			if mines == target:
+				val = 0
+			elif mines + unassigned == target:
+				val = 1
+			else:
+				continue
+
+			for v in cons_vars[ci]:
+				if assignment[v] is None:
+					assign(v, val)
+					cons_queue.extend(var_cons[v])
+
+		return True
+
+	# Every variable before the latest decision's was set before it was made,
+	# so the search only needs to start after it
+	def next_unassigned():
+		start = decisions[-1][1] + 1 if decisions else 0
+		for v in range(start, len(assignment)):
+			if assignment[v] is None:
+				return v
+		return None
+
+	if not propagate(list(range(len(constraints)))):
+		return counts, tallies
+
+	# Decisions as (trail length before, variable, value tried)
+	decisions = []
+	steps = 0
+	max_steps = None if budget is None else budget.steps_left
+	deadline = None if budget is None else budget.deadline
+
+	while True:
+		steps += 1
+		if max_steps is not None and steps > max_steps:
+			budget.steps_left = 0
+			raise SolverLimit(max_steps)
+		if (
+			deadline is not None and
+			steps % DEADLINE_CHECK_STEPS == 0 and
+			time.time() > deadline
+		):
+			if max_steps is not None:
+				budget.steps_left -= steps
+			raise SolverLimit(steps)
+
+		v = next_unassigned()
+		ok = True
+
+		if v is None:
+			k = sum(assignment)
+			counts[k] += 1
+			for cell, val in zip(cells, assignment):
+				if val:
+					tallies[cell][k] += 1
+			ok = False
+		else:
+			decisions.append((len(trail), v, 0))
+			assign(v, 0)
+			ok = propagate(list(var_cons[v]))
+
+		# Backtrack to the latest decision which hasn't tried both values
+		while not ok:
+			if not decisions:
+				if max_steps is not None:
+					budget.steps_left -= steps
+				return counts, tallies
+
+			trail_len, v, val = decisions.pop()
+			undo(trail_len)
+			if val == 0:
+				decisions.append((trail_len, v, 1))
+				assign(v, 1)
+				ok = propagate(list(var_cons[v]))
+
+# Product of two polynomials given as coefficient lists, dropping terms above
+# degree `limit`.
+def convolve(a, b, limit):
+	ret = [0] * min(len(a) + len(b) - 1, limit + 1)
+	for i, x in enumerate(a[:len(ret)]):
+		if not x:
+			continue
+		for j, y in enumerate(b[:len(ret) - i]):
+			ret[i + j] += x * y
+	return ret
+
+# Combine the solution counts of each component, as returned by
+# count_component_solutions, into the probability of each constrained cell
+# being a mine, and of any one interior cell being a mine. Each combination is
+# weighted by interior_ways(k), the number of ways (or any value proportional)
+# to place the rest of the mines among the interior cells when there are k
+# mines in the constrained cells. Returns (None, None) if no arrangement fits.
+def combine_components(components, interior_ways, interior_count, mines_left):
+	# Combined solution counts of all components before/after each one
+	prefix = [[1]]
+	for counts, _ in components:
+		prefix.append(convolve(prefix[-1], counts, mines_left))
+	suffix = [[1]]
+	for counts, _ in reversed(components):
+		suffix.append(convolve(suffix[-1], counts, mines_left))
+	suffix.reverse()
+
+	ways = [
+		interior_ways(k)
+		for k in range(sum(len(counts) for counts, _ in components) + 1)
+	]
+
+	all_counts = prefix[-1]
+	total = sum(map(operator.mul, all_counts, ways))
+	if total == 0:
+		return None, None
+
+	probabilities = {}
+	for i, (counts, tallies) in enumerate(components):
+		others = convolve(prefix[i], suffix[i + 1], mines_left)
+
+		# Total weight of the other components and interior, given k mines in
+		# this one
+		weights = [
+			sum(map(operator.mul, others, ways[k:]))
+			for k in range(len(counts))
+		]
+
+		for cell, tally in tallies.items():
+			probabilities[cell] = sum(
+				t * w for t, w in zip(tally, weights)
+			) / total
+
+	interior_probability = None
+	if interior_count > 0:
+		interior_probability = sum(
+			count * ways[k] * (mines_left - k)
+			for k, count in enumerate(all_counts)
+		) / (total * interior_count)
+
+	return probabilities, interior_probability
+
+# nCr(n, r - k) for each k up to max_k, for n interior cells and r mines left,
+# all multiplied by the same constant so that they're exact integers of no more
+# than around max_k * log2(n) bits; nCr itself is far too large to work out for
+# the interior of a large board. Each is the one before times (r - k + 1) /
+# (n - r + k), from the first k which leaves no more mines than interior cells.
+def interior_ways_table(n, r, max_k):
+	first = max(r - n, 0)
+	if first > max_k:
+		return [0] * (max_k + 1)
+
+	# Products of the numerators before each k, and of the denominators from
+	# each k on
+	numers = [1]
+	for k in range(first, max_k):
+		numers.append(numers[-1] * (r - k))
+	denoms = [1]
+	for k in range(max_k, first, -1):
+		denoms.append(denoms[-1] * (n - r + k))
+	denoms.reverse()
+
+	return [0] * first + list(map(operator.mul, numers, denoms))
+
+# The exact probability of each constrained cell being a mine, and of any one
+# interior cell being a mine; see combine_components. Raises SolverLimit if the
+# components need more than max_steps search steps between them. Components are
+# counted with solve_component, which takes the same arguments as
+# count_component_solutions (e.g. to look them up in a cache instead).
+def mine_probabilities(
+	constraints,
+	interior_count,
+	mines_left,
+	max_steps=None,
+	solve_component=count_component_solutions
+):
+	budget = None if max_steps is None else StepBudget(max_steps)
+	components = [
+		solve_component(cells, cons, budget)
+		for cells, cons in split_components(constraints)
+	]
+
+	ways = interior_ways_table(
+		interior_count,
+		mines_left,
+		sum(len(counts) for counts, _ in components)
+	)
+
+	def interior_ways(constrained_mines):
+		return ways[constrained_mines]
+
+	return combine_components(
+		components,
+		interior_ways,
+		interior_count,
+		mines_left
+	)
+
+# Estimates the solution counts of a component which is too large to
+# enumerate, by sequential Monte Carlo over batches of arrangements. Cells are
+# set one at a time (in breadth-first order through the constraints), each to
+# whichever values keep every constraint satisfiable; where both are possible,
+# a mine is chosen with the average ratio of mines still needed to cells still
+# unset in the cell's constraints (as for ReactiveClientAvgEmpties). Each
+# arrangement is weighted by the inverse of the probability of its choices, and
+# the batch is resampled by weight whenever too few arrangements carry most of
+# it, so dead ends are dropped early. Each batch gives an unbiased estimate of
+# the number of solutions.
+class ComponentSampler(object):
+	cells = None
+	samples = 0
+
+	# Estimated totals, as for count_component_solutions, summed over
+	# batches and scaled by exp(-log_scale)
+	counts = None
+	tallies = None
+	log_scale = None
+
+	# Each batch's fraction of arrangements with a mine in each cell, for
+	# the standard error of the estimates
+	batch_mine_ratios = None
+
+	def __init__(self, cells, constraints):
+		cell_cons = { cell : [] for cell in cells }
+		for ci, (cons_cells, _) in enumerate(constraints):
+			for cell in cons_cells:
+				cell_cons[cell].append(ci)
+
+		# Breadth-first order, so constraints are completed soon after
+		# they're started
+		self.cells = [cells[0]]
+		seen = { cells[0] }
+		for cell in self.cells:
+			for ci in cell_cons[cell]:
+				for other in constraints[ci][0]:
+					if other not in seen:
+						seen.add(other)
+						self.cells.append(other)
+
+		self.targets = numpy.array([mines for _, mines in constraints])
+		self.sizes = numpy.array([len(cs) for cs, _ in constraints])
+		self.var_cons = [numpy.array(cell_cons[cell]) for cell in self.cells]
+
+		self.counts = numpy.zeros(len(cells) + 1)
+		self.tallies = numpy.zeros((len(cells), len(cells) + 1))
+		self.batch_mine_ratios = []
+
+	# Sample a batch of arrangements. Returns False, keeping nothing from the
+	# batch, if the deadline passes before it's done.
+	def sample(self, batch_size, deadline=None):
+		mines = numpy.zeros((batch_size, len(self.cells)), dtype=bool)
+		cons_mines = numpy.zeros((batch_size, len(self.targets)), numpy.int16)
+		cons_unset = numpy.tile(self.sizes.astype(numpy.int16), (batch_size, 1))
+		log_weights = numpy.zeros(batch_size)
+		log_total = 0.0
+
+		for v, cs in enumerate(self.var_cons):
+			if deadline is not None and time.time() > deadline:
+				return False
+
+			targets = self.targets[cs]
+			can_mine = (cons_mines[:, cs] < targets).all(axis=1)
+			can_clear = (
+				cons_mines[:, cs] + cons_unset[:, cs] > targets
+			).all(axis=1)
+			either = can_mine & can_clear
+
+			proposal = numpy.clip(
+				(
+					(targets - cons_mines[:, cs]) / cons_unset[:, cs]
+				).mean(axis=1),
+				0.02,
+				0.98
+			)
+			mine = numpy.where(
+				either,
+				numpy.random.random(batch_size) < proposal,
+				can_mine
+			)
+			log_weights -= numpy.where(
+				either,
+				numpy.log(numpy.where(mine, proposal, 1 - proposal)),
+				0
+			)
+			log_weights[~(can_mine | can_clear)] = -numpy.inf
+
+			mines[:, v] = mine
+			cons_mines[:, cs] += mine[:, numpy.newaxis]
+			cons_unset[:, cs] -= 1
+
+			top = log_weights.max()
+			if top == -numpy.inf:
+				self.samples += batch_size
+				return True
+			weights = numpy.exp(log_weights - top)
+
+			# Resample when the effective sample size drops below half, and at
+			# the end so each arrangement carries the same weight
+			if (
+				v == len(self.var_cons) - 1 or
+				weights.sum() ** 2 < (weights ** 2).sum() * batch_size / 2
+			):
+				log_total += math.log(weights.mean()) + top
+				picks = numpy.random.choice(
+					batch_size,
+					batch_size,
+					p=weights / weights.sum()
+				)
+				mines = mines[picks]
+				cons_mines = cons_mines[picks]
+				cons_unset = cons_unset[picks]
+				log_weights[:] = 0
+
+		if self.log_scale is None or log_total > self.log_scale:
+			if self.log_scale is not None:
+				rescale = math.exp(self.log_scale - log_total)
+				self.counts *= rescale
+				self.tallies *= rescale
+			self.log_scale = log_total
+
+		# Each arrangement stands for an equal share of the estimated total
+		weight = math.exp(log_total - self.log_scale) / batch_size
+		num_mines = mines.sum(axis=1)
+		self.counts += weight * numpy.bincount(
+			num_mines,
+			minlength=len(self.counts)
+		)
+		rows, cols = numpy.nonzero(mines)
+		numpy.add.at(self.tallies, (cols, num_mines[rows]), weight)
+		self.batch_mine_ratios.append(mines.mean(axis=0))
+		self.samples += batch_size
+		return True
+
+	# Standard error of each cell's mine ratio, from the spread between
+	# batches; as large as possible with fewer than two batches.
+	def standard_errors(self):
+		if len(self.batch_mine_ratios) < 2:
+			errors = numpy.full(len(self.cells), 0.5)
+		else:
+			errors = numpy.std(self.batch_mine_ratios, axis=0, ddof=1) / (
+				math.sqrt(len(self.batch_mine_ratios))
+			)
+		return dict(zip(self.cells, errors.tolist()))
+
+	# Estimated counts and tallies, in the form of count_component_solutions,
+	# or None if no valid arrangement has been found yet
+	def solutions(self):
+		top = self.counts.max()
+		if top == 0:
+			return None
+		return (
+			(self.counts / top).tolist(),
+			{
+				cell : tally.tolist()
+				for cell, tally in zip(self.cells, self.tallies / top)
+			}
+		)
+
+# Estimated mine probabilities, as for mine_probabilities, within a time and/or
+# sample budget. Components which can be enumerated within exact_steps search
+# steps are counted exactly; the rest are sampled in turn, a batch at a time,
+# until either budget runs out (with neither, one batch each). The time budget
+# covers the exact counts too; no count or batch is started once it's spent, and
+# a batch still going when it runs out is dropped.
+# Also returns the standard error of each cell's estimate (zero for exact
+# components; for interior cells, keyed None, the largest of any component) and
+# the number of arrangements sampled. Returns Nones for the probabilities if
+# time runs out before every component is counted or sampled once, or if any
+# sampled component has no valid arrangements. solve_component is as for
+# mine_probabilities.
+def estimate_mine_probabilities(
+	constraints,
+	interior_count,
+	mines_left,
+	time_budget=None,
+	sample_budget=None,
+	batch_size=1000,
+	exact_steps=1000,
+	solve_component=count_component_solutions
+):
+	deadline = None if time_budget is None else time.time() + time_budget
+
+	def out_of_time():
+		return deadline is not None and time.time() > deadline
+
+	components = []
+	samplers = []
+	for cells, cons in split_components(constraints):
+		if out_of_time():
+			return None, None, None, 0
+		try:
+			components.append(solve_component(
+				cells,
+				cons,
+				StepBudget(exact_steps, deadline)
+			))
+		except SolverLimit:
+			samplers.append(ComponentSampler(cells, cons))
+
+	samples = 0
+
+	def budget_left():
+		if sample_budget is not None and samples >= sample_budget:
+			return False
+		if out_of_time():
+			return False
+		return time_budget is not None or sample_budget is not None
+
+	# One batch each, then more in turn while the budget lasts; a batch still
+	# going when time runs out is dropped
+	for sampler in samplers:
+		if not sampler.sample(batch_size, deadline):
+			return None, None, None, samples
+		samples += batch_size
+	while samplers and budget_left():
+		for sampler in samplers:
+			if not sampler.sample(batch_size, deadline):
+				break
+			samples += batch_size
+			if not budget_left():
+				break
+
+	sampled = [sampler.solutions() for sampler in samplers]
+	if any(s is None for s in sampled):
+		return None, None, None, samples
+
+	# Relative numbers of ways to place the rest of the mines among the
+	# interior cells, in floats; exact counts are far too large for these.
+	max_constrained = sum(len(tallies) for _, tallies in components) + sum(
+		len(sampler.cells) for sampler in samplers
+	)
+	log_ways = [
+		log_comb(interior_count, mines_left - k)
+		for k in range(min(max_constrained, mines_left) + 1)
+	]
+	top = max(log_ways)
+
+	def interior_ways(constrained_mines):
+		if constrained_mines >= len(log_ways):
+			return 0
+		return math.exp(log_ways[constrained_mines] - top)
+
+	probabilities, interior_probability = combine_components(
+		components + sampled,
+		interior_ways,
+		interior_count,
+		mines_left
+	)
+	if probabilities is None:
+		return None, None, None, samples
+
+	errors = { cell : 0 for _, tallies in components for cell in tallies }
+	for sampler in samplers:
+		errors.update(sampler.standard_errors())
+	if interior_probability is not None:
+		errors[None] = max(errors.values(), default=0)
+
+	return probabilities, interior_probability, errors, samples
+
+# log(nCr(n, r)), or -inf where nCr is zero
+def log_comb(n, r):
+	if r < 0 or r > n:
+		return -math.inf
+	return math.lgamma(n + 1) - math.lgamma(r + 1) - math.lgamma(n - r + 1)
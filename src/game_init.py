@@ -1,21 +1,136 @@
 #!/usr/bin/env python3
-"""Start a number of client-server pairs to play the specified games."""
-#TODO: take CLI-style arguments too
+"""Play a number of client-server games on a pool of worker processes, and
+write out the result of each game and the totals for each config.
+
+Configs are given as a JSON list of objects with "dims", "mines" and optionally
+"repeats", "seed", and "client" and "server" (names of classes in guess_ais),
+e.g.:
+
+	game_init.py -w 8 -o out.json \\
+		'[{"dims": [16, 16], "mines": 40, "repeats": 100,
+		"client": "ReactiveClientAvgEmptiesBalanced"}]'
+"""
 
 import sys
 import json
+import argparse
+import multiprocessing
+import numpy
 
 import guess_ais
+from game_results import GameResult, play_game, play_games, server_takes_seed
+from scheduling import CostEstimates, ChunkScheduler, run_scheduled
 
-def run_game_config(
+def game_configs(
 	dims,
 	mines,
 	repeats=1,
 	client=guess_ais.ReactiveClient,
-	server=guess_ais.PythonInternalServer
+	server=guess_ais.PythonInternalServer,
+	seed=None
 ):
-	for _ in range(repeats):
-		client(server(dims, mines))
+	"""Configs for each repeat of a game, for game_results.play_game. Given a
+	seed, repeat i is played with seed + i; otherwise, if the server takes a
+	seed, each repeat gets one drawn from fresh entropy here. (Leaving the
+	server to pick would have every forked worker draw the same boards, from its
+	copy of numpy's global random state.) Servers which don't take a seed get
+	None."""
+	if seed is not None:
+		seeds = range(seed, seed + repeats)
+	elif server_takes_seed(server):
+		seeds = numpy.random.SeedSequence().generate_state(repeats).tolist()
+	else:
+		seeds = [None] * repeats
+
+	return [
+		{
+			"client": client,
+			"server": server,
+			"dims": tuple(dims),
+			"mines": mines,
+			"seed": game_seed
+		}
+		for game_seed in seeds
+	]
+
+def run_game_config(*args, **kwargs):
+	"""Play each repeat of a game config in this process, and return the
+	results"""
+	return [play_game(config) for config in game_configs(*args, **kwargs)]
+
+def run_batch(cfgs, workers=None):
+	"""Play every game of each of a list of config dicts (arguments for
+	game_configs), spread over a process pool. Returns a list of results per
+	config."""
+	# Index of each game's config in cfgs, and of the game among the config's
+	# games, by the game's config dict
+	cfg_indices = {}
+	games = []
+	results = []
+	for i, cfg in enumerate(cfgs):
+		configs = game_configs(**cfg)
+		for j, config in enumerate(configs):
+			cfg_indices[id(config)] = i, j
+			games.append(config)
+		results.append([None] * len(configs))
+
+	estimates = CostEstimates()
+	scheduler = ChunkScheduler(
+		games,
+		estimates,
+		workers or multiprocessing.cpu_count()
+	)
+
+	def record(chunk, chunk_results):
+		for config, result in zip(chunk, chunk_results):
+			i, j = cfg_indices[id(config)]
+			results[i][j] = result
+			estimates.add(result)
+
+	if workers == 1:
+		chunk = scheduler.next_chunk()
+		while chunk is not None:
+			record(chunk, play_games(chunk)[2])
+			chunk = scheduler.next_chunk()
+	else:
+		with multiprocessing.Pool(workers) as pool:
+			for chunk, (_, _, played) in run_scheduled(
+				pool,
+				play_games,
+				scheduler
+			):
+				record(chunk, played)
+
+	return results
+
+def summarise(cfg, results):
+	"""Win rate and mean timings of one config's results"""
+	games = len(results)
+	return {
+		"client": cfg.get("client", guess_ais.ReactiveClient).__name__,
+		"server": cfg.get("server", guess_ais.PythonInternalServer).__name__,
+		"dims": list(cfg["dims"]),
+		"mines": cfg["mines"],
+		"games": games,
+		"wins": sum(1 for r in results if r.win),
+		"win_rate": sum(1 for r in results if r.win) / games if games else None,
+		"mean_total_time": (
+			sum(r.total_time for r in results) / games if games else None
+		),
+		"mean_wait_time": (
+			sum(r.wait_time for r in results) / games if games else None
+		),
+		"mean_guesses": (
+			sum(r.guesses for r in results) / games if games else None
+		)
+	}
+
+def game_record(config_index, result):
+	"""A result as a JSON object"""
+	record = { field: getattr(result, field) for field in GameResult.fields }
+	record["dims"] = list(result.dims)
+	record["config"] = config_index
+	return record
 
 def str_to_class(obj):
 	"""Get class types from strings for the client/server parameters"""
@@ -25,12 +140,52 @@ def str_to_class(obj):
 	return obj
 
 if __name__ == '__main__':
+	parser = argparse.ArgumentParser(
+		description=__doc__,
+		formatter_class=argparse.RawDescriptionHelpFormatter
+	)
+	parser.add_argument("configs", help="JSON list of game configs")
+	parser.add_argument(
+		"-w",
+		"--workers",
+		type=int,
+		default=multiprocessing.cpu_count(),
+		help="number of worker processes (default: number of CPUs); 1 to play "
+			"in this process"
+	)
+	parser.add_argument(
+		"-o",
+		"--output",
+		help="file to write results to as JSON (default: stdout)"
+	)
+	args = parser.parse_args()
+
 	try:
-		args = json.loads(sys.argv[1], object_hook=str_to_class)
-		print(args)
-	except:
-		print("Must provide parameters as a JSON string.")
-		raise
-	for cfg in args:
-		# Convert JSON strings to class types
-		run_game_config(**cfg)
\ No newline at end of file
+		cfgs = json.loads(args.configs, object_hook=str_to_class)
+	except (ValueError, AttributeError) as e:
+		parser.error("Must provide configs as a JSON list: {}".format(e))
+
+	results = run_batch(cfgs, args.workers)
+
+	output = {
+		"configs": [
+			summarise(cfg, cfg_results)
+			for cfg, cfg_results in zip(cfgs, results)
+		],
+		"games": [
+			game_record(i, result)
+			for i, cfg_results in enumerate(results)
+			for result in cfg_results
+		]
+	}
+
+	if args.output is None:
+		json.dump(output, sys.stdout, indent="\t")
+		print()
+	else:
+		with open(args.output, "w") as f:
+			json.dump(output, f, indent="\t")
+
+		for summary in output["configs"]:
+			print("{client} {dims} {mines} mines: won {wins}/{games}, "
+				"{mean_total_time:.4f}s per game".format(**summary))
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+import os
+import sys
+import csv
+import time
+import hashlib
+import inspect
+import functools
+
+import guess_ais
+
+# Summary of one played game. Small and picklable, so it can be passed back
+# from a worker process in place of the client object, which references the
+# whole cell grid and the server.
+class GameResult(object):
+	# In order, as stored by ResultStore
+	fields = (
+		"client",
+		"server",
+		"version",
+		"dims",
+		"mines",
+		"seed",
+		"win",
+		"cells_rem",
+		"total_time",
+		"wait_time",
+		"guesses"
+	)
+
+	client = None
+	server = None
+	version = None
+	dims = None
+	mines = None
+	seed = None
+
+	win = False
+	cells_rem = None
+	total_time = None
+	wait_time = None
+	guesses = None
+
+	def __init__(self, **kwargs):
+		for field, val in kwargs.items():
+			if field not in self.fields:
+				raise Exception("Unknown result field: {}".format(field))
+			setattr(self, field, val)
+
+	# Identifies the game played, for finding results already stored
+	def key(self):
+		return (
+			self.client,
+			self.server,
+			self.version,
+			self.dims,
+			self.mines,
+			self.seed
+		)
+
+	def __repr__(self):
+		return "GameResult({}, {}, {} mines, seed {}: {})".format(
+			self.client,
+			"x".join(str(d) for d in self.dims),
+			self.mines,
+			self.seed,
+			"win" if self.win else "{} left".format(self.cells_rem)
+		)
+
+# Hash of the source code which can affect games between the given client and
+# server classes: that of every class they inherit from, and of every module of
+# this package those classes' modules use, recursively. Other subclasses of the
+# same base classes are left out, so that changing one client doesn't change
+# the version of the others in its module.
+@functools.lru_cache(maxsize=None)
+def code_version(client, server):
+	package_dir = os.path.dirname(os.path.abspath(__file__))
+	classes = set(client.__mro__ + server.__mro__) - { object }
+	bases = (client.__mro__[-2], server.__mro__[-2])
+
+	def package_module(obj):
+		module = obj if inspect.ismodule(obj) else sys.modules.get(
+			getattr(obj, "__module__", None)
+		)
+		path = getattr(module, "__file__", None)
+		if path is None or os.path.dirname(os.path.abspath(path)) != (
+			package_dir
+		):
+			return None
+		return module
+
+	version = hashlib.sha1()
+	modules = sorted(
+		set(package_module(c) for c in classes) - { None },
+		key=lambda m: m.__name__
+	)
+	seen = set(modules)
+
+	for module in modules:
+		source = inspect.getsource(module)
+		for obj in vars(module).values():
+			if (
+				inspect.isclass(obj) and
+				obj.__module__ == module.__name__ and
+				obj not in classes and
+				issubclass(obj, bases)
+			):
+				source = source.replace(inspect.getsource(obj), "")
+		version.update(module.__name__.encode())
+		version.update(source.encode())
+
+		for obj in vars(module).values():
+			used = package_module(obj)
+			if used is not None and used not in seen:
+				seen.add(used)
+				modules.append(used)
+
+	return version.hexdigest()[:12]
+
+# The key a game config's result would have
+def config_key(config):
+	server = config.get("server", guess_ais.PythonInternalServer)
+	return (
+		config["client"].__name__,
+		server.__name__,
+		code_version(config["client"], server),
+		tuple(int(d) for d in config["dims"]),
+		int(config["mines"]),
+		None if config["seed"] is None else int(config["seed"])
+	)
+
+# Whether a server class can be given a seed, to play a set board
+def server_takes_seed(server):
+	return "seed" in inspect.signature(server).parameters
+
+# Play the game given by a config dict of "client" and "server" classes (the
+# server defaulting to PythonInternalServer), "dims", "mines" and "seed". The
+# seed is only passed on if it's not None, as not every server takes one. For
+# use as a process pool's worker function, so kept at module level.
+def play_game(config):
+	server = config.get("server", guess_ais.PythonInternalServer)
+	server_args = {}
+	if config["seed"] is not None:
+		server_args["seed"] = config["seed"]
+
+	game = config["client"](
+		server(config["dims"], config["mines"], **server_args),
+		first_coords=0
+	)
+
+	client, server_name, version, dims, mines, seed = config_key(config)
+	return GameResult(
+		client=client,
+		server=server_name,
+		version=version,
+		dims=dims,
+		mines=mines,
+		seed=seed,
+		win=bool(game.server.win),
+		cells_rem=int(game.server.cells_rem),
+		total_time=game.total_time,
+		wait_time=game.wait_time,
+		guesses=game.guesses
+	)
+
+# Play each of a list of game configs, as for play_game, so that a worker can
+# be given several games at once. Returns the worker's process id and the
+# seconds spent along with the results, for SessionMetrics.
+def play_games(configs):
+	start_time = time.time()
+	results = [play_game(config) for config in configs]
+	return os.getpid(), time.time() - start_time, results
+
+# Append-only CSV file of game results, one row per game, written as each one
+# finishes so that a long session which is stopped part-way can be resumed;
+# configs whose results are already stored don't need playing again. Results
+# are keyed by the code version of the client and server as well as the game,
+# so the file also serves as a cache between sessions: only games with new or
+# changed clients need playing. Only the keys of stored results are kept in
+# memory. A row left incomplete by a crash is skipped when reading.
+#
+# With max_results set, the file is cut down to that many of its most recent
+# results on opening, and again on closing if the session has taken it past
+# that; never in between, so results in use by a session aren't dropped
+# part-way through it.
+class ResultStore(object):
+	path = None
+	keys = None
+	max_results = None
+	# Number of results in the file
+	stored = 0
+
+	def __init__(self, path, max_results=None):
+		self.path = path
+		self.max_results = max_results
+		self.keys = set()
+		self.stored = 0
+		for result in self.results():
+			self.keys.add(result.key())
+			self.stored += 1
+
+		self.trim()
+
+		new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+		if not new_file:
+			with open(path, "rb") as f:
+				f.seek(-1, os.SEEK_END)
+				ends_in_newline = f.read() == b"\n"
+
+		self.file = open(path, "a", newline="")
+		self.writer = csv.writer(self.file)
+
+		if new_file:
+			self.writer.writerow(GameResult.fields)
+		elif not ends_in_newline:
+			# End the incomplete row, so it's skipped
+			self.file.write("\n")
+		self.file.flush()
+
+	def __contains__(self, config):
+		return config_key(config) in self.keys
+
+	def __len__(self):
+		return len(self.keys)
+
+	def append(self, result):
+		self.writer.writerow(self.row(result))
+		self.file.flush()
+		self.keys.add(result.key())
+		self.stored += 1
+
+	def close(self):
+		self.file.close()
+		self.trim()
+
+	# Drop the oldest results over max_results, if any
+	def trim(self):
+		if self.max_results is not None and self.stored > self.max_results:
+			self.evict(self.stored - self.max_results)
+
+	# Rewrite the file without its first (oldest) count results
+	def evict(self, count):
+		self.keys = set()
+
+		temp_path = self.path + ".tmp"
+		with open(temp_path, "w", newline="") as f:
+			writer = csv.writer(f)
+			writer.writerow(GameResult.fields)
+			for i, result in enumerate(self.results()):
+				if i >= count:
+					writer.writerow(self.row(result))
+					self.keys.add(result.key())
+		os.replace(temp_path, self.path)
+		self.stored -= count
+
+	# A result's values as written to the file
+	def row(self, result):
+		return (
+			result.client,
+			result.server,
+			result.version,
+			"x".join(str(d) for d in result.dims),
+			result.mines,
+			"" if result.seed is None else result.seed,
+			int(result.win),
+			result.cells_rem,
+			result.total_time,
+			result.wait_time,
+			result.guesses
+		)
+
+	# Read back stored results, optionally only those of one client, one at a
+	# time
+	def results(self, client=None):
+		if not os.path.exists(self.path):
+			return
+
+		with open(self.path, newline="") as f:
+			reader = csv.reader(f)
+
+			header = next(reader, None)
+			if header is not None and tuple(header) != GameResult.fields:
+				raise Exception(
+					"{} has unexpected columns: {}".format(self.path, header)
+				)
+
+			for row in reader:
+				if len(row) != len(GameResult.fields):
+					continue
+				if client is not None and row[0] != client.__name__:
+					continue
+
+				try:
+					yield GameResult(
+						client=row[0],
+						server=row[1],
+						version=row[2],
+						dims=tuple(int(d) for d in row[3].split("x")),
+						mines=int(row[4]),
+						seed=int(row[5]) if row[5] else None,
+						win=row[6] == "1",
+						cells_rem=int(row[7]),
+						total_time=float(row[8]),
+						wait_time=float(row[9]),
+						guesses=int(row[10])
+					)
+				except ValueError:
+					continue
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+
+# Compare memory use and turn time of the Cell object client grid against the
+# flat array client grid, playing the same games.
+
+import tracemalloc
+import numpy
+
+from reactive_ai import (
+	ReactiveClient,
+	ReactiveClientCheckShared
+)
+from array_ai import ArrayReactiveClient, ArrayReactiveClientCheckShared
+from internal_server import CountingServer
+
+def test(client, dims, mines, seed):
+	numpy.random.seed(seed)
+	server = CountingServer(dims, mines)
+
+	tracemalloc.start()
+	game = client(server, first_coords=server.zero_cell_coords())
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+
+	print("{:<32}{:>12}{:>6} turns{:>10.3f}ms/turn{:>10.1f}MB peak".format(
+		client.__name__,
+		"x".join(str(d) for d in dims),
+		server.turns,
+		1000 * game.total_time / server.turns,
+		peak / 2 ** 20
+	))
+
+for dims, mines in (
+	((100, 100), 800),
+	((200, 200), 3200),
+	((25, 25, 25), 400)
+):
+	for client in (
+		ReactiveClient,
+		ArrayReactiveClient,
+		ReactiveClientCheckShared,
+		ArrayReactiveClientCheckShared
+	):
+		test(client, dims, mines, 1)
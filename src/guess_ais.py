@@ -3,34 +3,31 @@ import itertools
 import functools
 
 from reactive_ai import *
+import frontier_solver
 
 # Just finds first cleared cell with surrounding unknown empties.
 class ReactiveClientGuess(ReactiveClient):
-	# TODO: Refactor to use the function in ReactiveClientExhaustiveTest, and
-	# see if speed is noticeably affected. If not, just replace all the
-	# get_adjacent_unknown_cells functions with that one.
+	track_frontier = True
+
 	def get_adjacent_unknown_cells(self):
 		# TODO: Sometimes returns None; figure out the situation that causes
 		# this and see what might be the next best thing to do (just pick random
 		# unknown?)
-		for surr_empt_cell in self.known_cells[State.EMPTY]:
-			if surr_empt_cell.unkn_surr_empt_cnt <= 0:
-				continue
-
-			for unk_cell in surr_empt_cell.surr_cells:
-				if unk_cell.state == State.UNKNOWN:
-					yield (unk_cell, surr_empt_cell)
+		for unk_cell, surr_empties in self.frontier.items():
+			for surr_empt_cell in surr_empties:
+				yield (unk_cell, surr_empt_cell)
 
 	def get_guess_cell(self):
 		for (unk_cell, surr_empt_cell) in self.get_adjacent_unknown_cells():
 			return unk_cell
 
-# For all unknowns next to an empty, choose the one next to fewest empties
+# For all unknowns next to an empty, choose the one next to fewest empties.
+# Ties go to the first in frontier order.
 class ReactiveClientCountEmpties(ReactiveClientGuess):
 	def get_guess_cell(self):
-		adjacent_unknowns = set(
-			s[0] for s in self.get_adjacent_unknown_cells()
-		)
+		adjacent_unknowns = CellIndex()
+		for s in self.get_adjacent_unknown_cells():
+			adjacent_unknowns.add(s[0])
 
 		if len(adjacent_unknowns) == 0:
 			return None
@@ -42,11 +39,11 @@ class ReactiveClientCountEmpties(ReactiveClientGuess):
 
 # Just pick something.
 class ReactiveClientGuessAny(ReactiveClient):
+	track_unknowns = True
+
 	def get_guess_cell(self):
-		while True:
-			cell = self.game_grid[self.random_coords()]
-			if cell.state == State.UNKNOWN:
-				return cell
+		index = self.unknown_cells.choice()
+		return None if index is None else self.game_grid.from_index(index)
 
 # For all unknowns next to an empty, sum the unknown surrounding empty count vs
 # the total unknown surrounding count for each cleared empty cell. Choose the
@@ -70,15 +67,7 @@ class ReactiveClientAvgEmpties(ReactiveClientGuess):
 		return max(scores.items(), key=lambda c: c[1])[0]
 
 	def get_adjacent_unknown_cells(self):
-		unk_cells = {}
-		for surr_empt_cell in self.known_cells[State.EMPTY]:
-			for unk_cell in (
-				c for c in surr_empt_cell.surr_cells if c.state == State.UNKNOWN
-			):
-				if unk_cell not in unk_cells:
-					unk_cells[unk_cell] = []
-				unk_cells[unk_cell].append(surr_empt_cell)
-		return unk_cells.items()
+		return self.frontier.items()
 
 	def empty_ratio(self, cell, surr_empties):
 		empty_count = 0
@@ -88,119 +77,207 @@ class ReactiveClientAvgEmpties(ReactiveClientGuess):
 			mine_count += surr.unkn_surr_mine_cnt
 		return empty_count / ((empty_count + mine_count) or 1)
 
+# As above, but also consider unknown cells with no surrounding empties
+# (landlocked cells), which all get the same score.
 class ReactiveClientAvgEmptiesAll(ReactiveClientAvgEmpties):
 	landlocked_cell_score = lambda self: 2
 
+	# The frontier, plus the first landlocked cell, which stands in for the
+	# rest. Ties go to the first cell in coords order.
 	def get_guess_cell(self):
-		return self.get_best_scoring_unknown(
-			self.get_all_unknown_cells,
-			self.empty_ratio_all
-		)
-
-	def empty_ratio_all(self, cell, surr_empties):
-		surr_empties = list(surr_empties)
-
-		if len(surr_empties) == 0:
-			return self.landlocked_cell_score()
+		scores = [
+			(cell, self.empty_ratio(cell, surr_empties))
+			for cell, surr_empties in self.frontier.items()
+		]
 
-		return self.empty_ratio(cell, surr_empties)
+		landlocked_cell = self.first_landlocked_cell()
+		if landlocked_cell is not None:
+			scores.append((landlocked_cell, self.landlocked_cell_score()))
 
-	def get_all_unknown_cells(self):
-		for coords in self.all_coords():
-			cell = self.game_grid[coords]
-			if cell.state != State.UNKNOWN:
-				continue
+		if len(scores) == 0:
+			return None
 
-			yield (cell, (c for c in cell.surr_cells if c.state == State.EMPTY))
+		return max(scores, key=lambda c: (c[1], -c[0].index))[0]
 
 class ReactiveClientAvgEmptiesBalanced(ReactiveClientAvgEmptiesAll):
 	def landlocked_cell_score(self):
 		return (self.server.cells_rem / self.server.mines) / 10
 
-# TODO: Test every possible mine position; gather statisitcs to find most likely
-# candidate. Obviously slow.
+# Solutions of the frontier components counted for the last guess, keyed by
+# each component's constraints in sorted order. A component which no turn has
+# touched since has the same constraints, so is looked up instead of counted
+# again (taking no steps); any that changed get a new key, and entries not used
+# by a guess are dropped once it's made. Components which ran out of steps or
+# time are remembered too, with the steps they took, so they fail straight away
+# unless there are more steps left this time. Entries are (solutions, steps)
+# pairs, with one or the other None.
+class ComponentCache(object):
+	def __init__(self):
+		self.entries = {}
+		self.used_entries = {}
+		self.hits = 0
+		self.misses = 0
+
+	# As for frontier_solver.count_component_solutions
+	def solve(self, cells, constraints, budget=None):
+		key = tuple(sorted(constraints))
+		entry = self.entries.get(key)
+
+		if entry is not None and (
+			entry[0] is not None or (
+				budget is not None and
+				budget.steps_left is not None and
+				entry[1] >= budget.steps_left
+			)
+		):
+			self.hits += 1
+		else:
+			self.misses += 1
+			try:
+				entry = (
+					frontier_solver.count_component_solutions(
+						cells,
+						constraints,
+						budget
+					),
+					None
+				)
+			except frontier_solver.SolverLimit as e:
+				entry = (None, e.steps)
+
+		self.used_entries[key] = entry
+		if entry[0] is None:
+			raise frontier_solver.SolverLimit(entry[1])
+		return entry[0]
+
+	# Keep only the entries used since the last call
+	def end_guess(self):
+		self.entries = self.used_entries
+		self.used_entries = {}
+
+# Find the exact probability of each unknown cell being a mine, from every
+# possible arrangement of mines which fits the known cells; choose the safest.
+# Falls back to the average empties guess if the frontier is too tangled to
+# search in time.
 class ReactiveClientExhaustiveTest(ReactiveClientAvgEmpties):
-	# TODO: add to the cell_state_lookups list in the superclass, instead of
-	# replacing it.
-	cell_state_lookups = [ State.TO_CLEAR, State.EMPTY, State.MINE ]
-	split_edge_cells = False
+	# Search steps allowed for all the components of one guess between them
+	# before falling back; steps on large components can take 0.1ms or more
+	max_solver_steps = 5000
 
-	def get_adjacent_unknown_cells(self):
-		# TODO: Sometimes returns None; figure out the situation that causes
-		# this and see what might be the next best thing to do (just pick random
-		# unknown?)
-		for surr_empt_cell in self.known_cells[State.EMPTY]:
-			if surr_empt_cell.unkn_surr_empt_cnt <= 0:
-				continue
+	component_cache = None
+
+	def __init__(self, server, first_coords=None):
+		self.component_cache = ComponentCache()
+		super().__init__(server, first_coords)
+
+	# Each empty cell with unknown surrounding cells, as a constraint of its
+	# unknown surrounding cells (by coords) and how many are mines
+	def frontier_constraints(self):
+		unknown_coords = {}
+		for unk_cell, surr_empties in self.frontier.items():
+			for empty_cell in surr_empties:
+				if empty_cell not in unknown_coords:
+					unknown_coords[empty_cell] = []
+				unknown_coords[empty_cell].append(unk_cell.coords)
 
-			for unk_cell in surr_empt_cell.surr_cells:
-				if unk_cell.state == State.UNKNOWN:
-					yield unk_cell
+		for empty_cell, coords in unknown_coords.items():
+			yield tuple(sorted(coords)), empty_cell.unkn_surr_mine_cnt
 
 	def get_guess_cell(self):
-		# For each cleared mine, check that this configuration gives it the
-		# correct number of new surrounding mines.
-		def test_valid(edge_mines):
-			for empty_cell in self.known_cells[State.EMPTY]:
-				unkn_mine_count = empty_cell.unkn_surr_mine_cnt
-
-				if unkn_mine_count == 0:
-					continue
-
-				if unkn_mine_count - len(
-					edge_mines & frozenset(empty_cell.surr_cells)
-				) != 0:
-					return False
-			return True
-
-		# Combine sets into disjoint groups. Destructive to supplied 'sets'..
-		def combine_overlaps(sets):
-			for ((ai, a), (bi, b)) in itertools.combinations(
-				enumerate(sets),
-				2
-			):
-				if not a or not b:
-					continue
-
-				if not a.isdisjoint(b):
-					a |= b
-					sets[bi] = None
-
-			return [s for s in sets if s]
-
-		mines_left = self.server.mines - len(self.known_cells[State.MINE])
-		edge_cells = frozenset(self.get_adjacent_unknown_cells())
-		edge_mine_tally = { c : 0 for c in edge_cells }
-
-		if self.split_edge_cells:
-			# Divide edge_cells into groups based on contact with one another.
-			edge_cell_sets = combine_overlaps(
-				[(set(c.surr_cells) | {c}) & edge_cells for c in edge_cells]
+		constraints = list(self.frontier_constraints())
+
+		try:
+			probabilities, interior_probability = (
+				frontier_solver.mine_probabilities(
+					constraints,
+					self.landlocked_count(),
+					self.server.mines - len(self.known_cells[State.MINE]),
+					self.max_solver_steps,
+					self.component_cache.solve
+				)
 			)
-		else:
-			edge_cell_sets = [ edge_cells ]
-
-		# For each possible number of mines on the edge, see which combinations
-		# are possible, and tally the placement count in each edge cell.
-		# TODO: Break up edge mines further to reduce no. of combinations (using
-		# edge_cell_sets above)
-		# TODO: weight this based on nCr(inner cells, inner mines) for each
-		# num_edge_mines value.
-		for cell_set in edge_cell_sets:
-			for num_edge_mines in range(1, min(len(cell_set), mines_left) + 1):
-				for mine_combo in (frozenset(m) for m in itertools.combinations(
-					cell_set,
-					num_edge_mines
-				)):
-					if test_valid(mine_combo):
-						for cell in mine_combo:
-							edge_mine_tally[cell] += 1
-
-		if len(edge_mine_tally) == 0:
+		except frontier_solver.SolverLimit:
+			return super().get_guess_cell()
+		finally:
+			self.component_cache.end_guess()
+
+		if probabilities is None:
+			return super().get_guess_cell()
+
+		coords = self.safest_coords(probabilities, interior_probability)
+		return None if coords is None else self.game_grid[coords]
+
+	# Coords of the frontier cell least likely to be a mine, or of any interior
+	# cell if those are strictly safer. None if there are no unknown cells.
+	def safest_coords(self, probabilities, interior_probability):
+		best = min(probabilities.items(), key=lambda c: c[1], default=None)
+
+		if interior_probability is not None and (
+			best is None or interior_probability < best[1]
+		):
+			return self.first_landlocked_cell().coords
+
+		return None if best is None else best[0]
+
+# Components are always split now; kept under its old name for configs which
+# give it, as game_init looks clients up by name
+ReactiveClientExhaustiveSplit = ReactiveClientExhaustiveTest
+
+# As above, but estimates the probabilities by sampling arrangements of mines
+# wherever they can't be counted quickly, stopping after a set time or number of
+# samples; guesses take bounded time on any size of frontier. The estimated
+# mine probability of each guess, its standard error, and the number of samples
+# taken are kept in guess_estimates.
+class ReactiveClientMonteCarlo(ReactiveClientExhaustiveTest):
+	# Budget per guess; either can be None
+	guess_time_budget = 0.05
+	guess_sample_budget = 20000
+
+	# Small, so a batch of a large component takes a few ms and the first
+	# batch of each fits in the time budget
+	sample_batch_size = 250
+
+	# Search steps allowed per component before sampling it instead; kept low,
+	# as giving up on a tangled component can use a good part of the budget
+	exact_component_steps = 200
+
+	guess_estimates = None
+
+	def __init__(self, server, first_coords=None):
+		self.guess_estimates = []
+		super().__init__(server, first_coords)
+
+	def get_guess_cell(self):
+		constraints = list(self.frontier_constraints())
+
+		probabilities, interior_probability, errors, samples = (
+			frontier_solver.estimate_mine_probabilities(
+				constraints,
+				self.landlocked_count(),
+				self.server.mines - len(self.known_cells[State.MINE]),
+				self.guess_time_budget,
+				self.guess_sample_budget,
+				self.sample_batch_size,
+				self.exact_component_steps,
+				self.component_cache.solve
+			)
+		)
+		self.component_cache.end_guess()
+
+		if probabilities is None:
+			return ReactiveClientAvgEmpties.get_guess_cell(self)
+
+		coords = self.safest_coords(probabilities, interior_probability)
+		if coords is None:
 			return None
 
-		ret = min(edge_mine_tally.items(), key=lambda c: c[1])[0]
-		return ret
+		if coords in probabilities:
+			self.guess_estimates.append(
+				(probabilities[coords], errors[coords], samples)
+			)
+		else:
+			self.guess_estimates.append(
+				(interior_probability, errors[None], samples)
+			)
 
-class ReactiveClientExhaustiveSplit(ReactiveClientExhaustiveTest):
-	split_edge_cells = True
\ No newline at end of file
+		return self.game_grid[coords]
@@ -1,7 +1,15 @@
 #!/usr/bin/env python3
 import numpy
-import functools
+import operator
 import itertools
+import functools
+from scipy import ndimage
+
+from surrounding import (
+	surrounding_table,
+	surrounding_offsets,
+	TABLE_CACHE_MAX_CELLS
+)
 
 # Grid values
 # Use value of 1 directly for counting surrounding mines; ~20% game speedup
@@ -9,27 +17,135 @@ import itertools
 MINE = 1
 CLEAR = 0
 
+# Type of the server's game grid; the smallest which holds MINE and CLEAR, as a
+# large board's grid is the bulk of the memory a game uses.
+GRID_DTYPE = numpy.int8
+
+# Cell states in batched turn results; indices into turn_state_names, which
+# gives the equivalent state string from the JSON server.
+CELL_CLEARED = 0
+CELL_MINE = 1
+CELL_UNKNOWN = 2
+turn_state_names = ("cleared", "mine", "unknown")
+
+# One record per cell in batched turn results. "index" is the cell's flat index
+# into the grid (i.e. numpy.ravel_multi_index of its coords).
+turn_cell_dtype = numpy.dtype([
+	("index", numpy.intp),
+	("surrounding", numpy.int16),
+	("state", numpy.int8)
+])
+
+# Largest board to look surrounding coords up in a shared surrounding table for
+# (see surrounding.py); larger boards' tables aren't kept between calls
+SURROUNDING_TABLE_MAX_CELLS = TABLE_CACHE_MAX_CELLS
+
+# Coords of each cell surrounding the given coords, not including itself. For
+# boards too large for a table, they're worked out from the offsets each time.
 def get_surrounding_coords(coords, dims):
-	ret = []
+	if functools.reduce(lambda x,y: x*y, dims) > SURROUNDING_TABLE_MAX_CELLS:
+		surr_coords = (
+			tuple(map(operator.add, coords, offset))
+			for offset in cached_surrounding_offsets(len(dims))
+		)
+		if all(0 < c < d - 1 for c, d in zip(coords, dims)):
+			return tuple(surr_coords)
+		return tuple(
+			surr for surr in surr_coords
+			if all(0 <= c < d for c, d in zip(surr, dims))
+		)
+	return surrounding_table(dims).surrounding_coords(tuple(coords))
+
+@functools.lru_cache(maxsize=None)
+def cached_surrounding_offsets(num_dims):
+	return tuple(surrounding_offsets(num_dims))
+
+# Number of surrounding mines for every cell of the grid at once, in the
+# smallest type which fits any count. Cells outside the grid count as clear.
+# The sum over each 3x3(x...) box is taken one axis at a time, then the cell's
+# own value is taken off; much quicker than a convolution over every box, which
+# matters for large boards.
+def count_surrounding_mines(game_grid):
+	counts = game_grid.astype(numpy.min_scalar_type(1 - 3 ** game_grid.ndim))
+
+	for axis in range(game_grid.ndim):
+		lower = [slice(None)] * game_grid.ndim
+		upper = [slice(None)] * game_grid.ndim
+		lower[axis] = slice(None, -1)
+		upper[axis] = slice(1, None)
+		lower, upper = tuple(lower), tuple(upper)
 
-	for offset in itertools.product(*([-1, 0, 1],) * len(coords)):
-		# Don't include self
-		if all(c == 0 for c in offset):
-			continue
+		box_counts = counts.copy()
+		box_counts[upper] += counts[lower]
+		box_counts[lower] += counts[upper]
+		counts = box_counts
 
-		surr_coords = tuple(sum(c) for c in zip(offset, coords))
+	counts -= game_grid
+	return counts
 
-		# Check all coords are positive
-		if any(c < 0 for c in surr_coords):
-			continue
+# Structuring element connecting a cell to all its surrounding cells, for
+# labelling/dilating regions of the grid
+def connectivity_structure(num_dims):
+	return numpy.ones((3,) * num_dims, dtype=bool)
 
-		# Check all coords are within grid size
-		if any(c >= d for c, d in zip(surr_coords, dims)):
-			continue
+# Remove repeated values from a 1-d array, keeping the first occurrence of each
+# in its original order
+def unique_in_order(arr):
+	_, first = numpy.unique(arr, return_index=True)
+	return arr[numpy.sort(first)]
 
-		ret.append(surr_coords)
+# Boards of up to this many cells are made by shuffling every cell; larger ones
+# by sampling the mines' positions, which takes time and memory in proportion
+# to the number of mines rather than the number of cells.
+SHUFFLE_MAX_CELLS = 4096
 
-	return ret
+# Place the given number of mines in a flat grid of clear cells at random, with
+# a numpy.random.Generator. Sampling picks positions with replacement, keeping
+# each one not already taken, until enough are; for boards over half full of
+# mines it picks the clear cells instead, so most positions picked are new.
+def place_mines(flat_grid, mines, rng):
+	cells = len(flat_grid)
+
+	if cells <= SHUFFLE_MAX_CELLS:
+		flat_grid[:mines] = MINE
+		rng.shuffle(flat_grid)
+		return
+
+	value, count = MINE, mines
+	if 2 * mines > cells:
+		flat_grid.fill(MINE)
+		value, count = CLEAR, cells - mines
+
+	index_dtype = numpy.min_scalar_type(cells - 1)
+	while count:
+		index = numpy.sort(rng.integers(cells, size=count, dtype=index_dtype))
+		index = index[flat_grid[index] != value]
+		if len(index):
+			index = index[numpy.concatenate(([True], index[1:] != index[:-1]))]
+		flat_grid[index] = value
+		count -= len(index)
+
+# A grid with the given number of mines placed at random. The same seed always
+# gives the same grid; with no seed, one is drawn from numpy's global random
+# state, so that seeding that still makes games repeatable.
+def random_grid(dims, mines, seed=None):
+	if seed is None:
+		seed = numpy.random.randint(2 ** 32)
+
+	grid = numpy.zeros(dims, dtype=GRID_DTYPE)
+	place_mines(grid.reshape(-1), mines, numpy.random.default_rng(seed))
+	return grid
+
+# random_grid for each of the given seeds, stacked into one (seeds, *dims)
+# array
+def random_grids(dims, mines, seeds):
+	grids = numpy.zeros((len(seeds),) + tuple(dims), dtype=GRID_DTYPE)
+	for seed, grid in zip(seeds, grids.reshape(len(seeds), -1)):
+		place_mines(grid, mines, numpy.random.default_rng(seed))
+	return grids
+
+# Default length of a ChunkedInternalServer chunk along each axis
+CHUNK_LENGTH = 64
 
 def count_empty_cells(dims, mines):
 	return functools.reduce(lambda x,y: x*y, dims) - mines
@@ -41,6 +157,17 @@ class PythonInternalServer(object):
 	# Whether the game server can be relied upon to auto-clear zero-cells.
 	clears_zeroes = False
 
+	# Whether the game server does anything with clients' debug info.
+	consumes_debug = False
+
+	# Whether clients may send debug info for only the cells changed since the
+	# previous turn, rather than every cell.
+	debug_changes_only = False
+
+	# Whether each turn's flags are only those new since the previous turn,
+	# rather than every flag so far.
+	flags_incremental = True
+
 	dims = None
 	mines = None
 	seed = None
@@ -50,17 +177,41 @@ class PythonInternalServer(object):
 	win = False
 
 	game_grid = None
+	surr_mine_counts = None
+
+	# Only used when clearing zeroes: labelled connected regions of zero-cells,
+	# bounding box of each region, and which cells have been revealed so far.
+	zero_regions = None
+	zero_region_slices = None
+	revealed = None
+
+	# Cells currently flagged by the client; not created until needed.
+	flagged = None
 
 	# Specify "grid" (n-dimensional list of 1s and 0s) to override other options
 	# and use a pre-determined game instead of random.
-	def __init__(self, dims=None, mines=None, seed=None, grid=None):
+	# Specify "clears_zeroes" to have each turn also clear every cell connected
+	# to a cleared zero-cell, instead of leaving that to the client.
+	# Specify "flags_incremental=False" to have each turn's flags replace all
+	# previous flags.
+	def __init__(
+		self,
+		dims=None,
+		mines=None,
+		seed=None,
+		grid=None,
+		clears_zeroes=False,
+		flags_incremental=True
+	):
+		self.flags_incremental = flags_incremental
+
 		if grid:
 			buffer = numpy.array(grid)
 			if buffer.dtype != int:
 				raise Exception(
 					"Supplied buffer is invalid: {}".format(buffer)
 				)
-			self.game_grid = numpy.ndarray(buffer.shape, buffer=buffer)
+			self.game_grid = buffer.astype(GRID_DTYPE)
 			self.dims = self.game_grid.shape
 			self.mines = numpy.count_nonzero(self.game_grid)
 		else:
@@ -69,42 +220,334 @@ class PythonInternalServer(object):
 			self.mines = mines
 			self.seed = seed
 
+		self.surr_mine_counts = count_surrounding_mines(self.game_grid)
 		self.cells_rem = count_empty_cells(self.dims, self.mines)
 		self.id = (self.dims, self.mines, self.seed)
 
+		if clears_zeroes:
+			self.clears_zeroes = True
+			self.zero_regions, _ = ndimage.label(
+				(self.surr_mine_counts == 0) & (self.game_grid == CLEAR),
+				structure=connectivity_structure(len(self.dims))
+			)
+			self.zero_region_slices = ndimage.find_objects(self.zero_regions)
+			self.revealed = numpy.zeros(self.dims, dtype=bool)
 
 	def random_grid(self, dims, mines, seed):
-		grid = numpy.ndarray(dims, dtype=int)
-		grid.fill(CLEAR)
-		grid.ravel()[:mines].fill(MINE)
-		if seed is not None:
-			numpy.random.seed(self.seed)
-		numpy.random.shuffle(grid.ravel())
-		return grid
+		return random_grid(dims, mines, seed)
 
 	def turn(self, clear=[], flag=[], debug=None, client=None):
-		cleared_cells = []
-		for coords in clear:
-			if self.game_grid[coords] == MINE:
-				self.game_over = True
-				return []
-			else:
-				cleared_cells.append({
-					"coords" : coords,
-					"surrounding" : sum([
-						self.game_grid[surr_coords]
-						for surr_coords in get_surrounding_coords(
-							coords,
-							self.dims
-						)
-					]),
-					"state" : "cleared"
-				})
+		cells = self.turn_array(clear, flag, debug, client)
+
+		return [
+			{
+				"coords" : coords,
+				"surrounding" : surrounding,
+				"state" : turn_state_names[state]
+			}
+			for coords, surrounding, state in zip(
+				zip(*(c.tolist() for c in numpy.unravel_index(
+					cells["index"],
+					self.dims
+				))),
+				cells["surrounding"].tolist(),
+				cells["state"].tolist()
+			)
+		]
+
+	# Batched equivalent of turn(). Takes an (n, len(dims)) array of coords to
+	# clear, and returns a turn_cell_dtype array with one record for each newly
+	# cleared cell. Repeated coords are only cleared once.
+	def turn_array(self, clear, flag=None, debug=None, client=None):
+		if flag is not None:
+			self.set_flags(flag)
+
+		clear = numpy.asarray(clear, dtype=numpy.intp)
+		flat_index = unique_in_order(numpy.ravel_multi_index(
+			tuple(clear.reshape(-1, len(self.dims)).T),
+			self.dims
+		))
+
+		if (self.game_grid.ravel()[flat_index] == MINE).any():
+			self.game_over = True
+			return numpy.empty(0, dtype=turn_cell_dtype)
+
+		if self.clears_zeroes:
+			flat_index = self.reveal_cells(flat_index)
+
+		cells = numpy.empty(len(flat_index), dtype=turn_cell_dtype)
+		cells["index"] = flat_index
+		cells["surrounding"] = self.surr_mine_counts.ravel()[flat_index]
+		cells["state"] = CELL_CLEARED
 
 		# Result already returned if game is lost
-		self.cells_rem -= len(clear)
+		self.cells_rem -= len(cells)
+		if self.cells_rem == 0:
+			self.win = True
+			self.game_over = True
+
+		return cells
+
+	# Takes an (n, len(dims)) array of coords, as for clearing
+	def set_flags(self, flag):
+		flag = numpy.asarray(flag, dtype=numpy.intp).reshape(-1, len(self.dims))
+
+		if self.flagged is None:
+			if len(flag) == 0:
+				return
+			self.flagged = numpy.zeros(self.dims, dtype=bool)
+		elif not self.flags_incremental:
+			self.flagged.fill(False)
+
+		self.flagged[tuple(flag.T)] = True
+
+	# Mark cells as revealed, along with the zero-region (plus border) of any
+	# zero-cells among them. Takes and returns unique flat indices; only cells
+	# which weren't already revealed are returned, requested cells first.
+	def reveal_cells(self, flat_index):
+		revealed = self.revealed.ravel()
+		flat_index = flat_index[~revealed[flat_index]]
+		revealed[flat_index] = True
+
+		new_cells = [flat_index]
+		for label in numpy.unique(self.zero_regions.ravel()[flat_index]):
+			if label != 0:
+				new_cells.append(self.reveal_zero_region(label))
+
+		return numpy.concatenate(new_cells)
+
+	def reveal_zero_region(self, label):
+		# Only look at the region's bounding box, grown by one for the border
+		box = tuple(
+			slice(max(s.start - 1, 0), s.stop + 1)
+			for s in self.zero_region_slices[label - 1]
+		)
+
+		region = ndimage.binary_dilation(
+			self.zero_regions[box] == label,
+			structure=connectivity_structure(len(self.dims))
+		)
+		region &= ~self.revealed[box]
+		self.revealed[box] |= region
+
+		return numpy.ravel_multi_index(
+			tuple(i + s.start for i, s in zip(region.nonzero(), box)),
+			self.dims
+		)
+
+# A server for boards too large to hold in memory. The board is split into
+# chunks of up to chunk_length cells along each axis, and a chunk's mines are
+# only generated, from the seed and the chunk's index, the first time a cell in
+# it or next to it is cleared; so only chunks around the cleared region of the
+# board are ever held. The same seed and chunk length always give the same
+# board.
+#
+# Each chunk's mine count is its share of the total at the board's mine
+# density, rounded so that the shares add up to the number of mines given;
+# cells_rem then comes straight from the density, without generating the whole
+# board. Flags are kept as a set of flat indices rather than a grid.
+#
+# Clients which keep arrays over the whole board (see FULL_BOARD_MAX_CELLS in
+# reactive_ai.py) refuse boards too large for them.
+class ChunkedInternalServer(PythonInternalServer):
+	chunk_dims = None
+	# Number of chunks along each axis
+	chunk_grid_dims = None
+
+	# Mines, and surrounding mine counts, by chunk coords; once generated
+	chunks = None
+	chunk_counts = None
+
+	def __init__(
+		self,
+		dims,
+		mines,
+		seed=None,
+		chunk_length=CHUNK_LENGTH,
+		flags_incremental=True
+	):
+		self.flags_incremental = flags_incremental
+
+		# Needed for generating every chunk later, so one is drawn up front
+		if seed is None:
+			seed = numpy.random.randint(2 ** 32)
+
+		self.dims = tuple(dims)
+		self.mines = mines
+		self.seed = seed
+		self.chunk_dims = tuple(min(d, chunk_length) for d in self.dims)
+		self.chunk_grid_dims = tuple(
+			-(-d // c) for d, c in zip(self.dims, self.chunk_dims)
+		)
+		self.chunks = {}
+		self.chunk_counts = {}
+
+		self.cells_rem = count_empty_cells(self.dims, self.mines)
+		self.id = (self.dims, self.mines, self.seed)
+
+	def turn_array(self, clear, flag=None, debug=None, client=None):
+		if flag is not None:
+			self.set_flags(flag)
+
+		clear = numpy.asarray(clear, dtype=numpy.intp)
+		flat_index = unique_in_order(numpy.ravel_multi_index(
+			tuple(clear.reshape(-1, len(self.dims)).T),
+			self.dims
+		))
+		coords = numpy.array(
+			numpy.unravel_index(flat_index, self.dims),
+			dtype=numpy.intp
+		).reshape(len(self.dims), -1)
+
+		# Look cells up one chunk at a time
+		chunk_coords = coords // numpy.array(self.chunk_dims)[:, None]
+		chunk_index = numpy.ravel_multi_index(
+			tuple(chunk_coords),
+			self.chunk_grid_dims
+		)
+		order = numpy.argsort(chunk_index, kind="stable")
+		starts = numpy.flatnonzero(numpy.diff(chunk_index[order], prepend=-1))
+
+		is_mine = numpy.empty(len(flat_index), dtype=bool)
+		surrounding = numpy.empty(len(flat_index), dtype=numpy.int16)
+
+		for group in numpy.split(order, starts)[1:]:
+			chunk = tuple(chunk_coords[:, group[0]].tolist())
+			within = tuple(
+				coords[:, group] -
+				(numpy.array(chunk) * self.chunk_dims)[:, None]
+			)
+			is_mine[group] = self.chunk_mines(chunk)[within] == MINE
+			surrounding[group] = self.chunk_surr_mine_counts(chunk)[within]
+
+		if is_mine.any():
+			self.game_over = True
+			return numpy.empty(0, dtype=turn_cell_dtype)
+
+		cells = numpy.empty(len(flat_index), dtype=turn_cell_dtype)
+		cells["index"] = flat_index
+		cells["surrounding"] = surrounding
+		cells["state"] = CELL_CLEARED
+
+		self.cells_rem -= len(cells)
 		if self.cells_rem == 0:
 			self.win = True
 			self.game_over = True
 
-		return cleared_cells
+		return cells
+
+	def set_flags(self, flag):
+		flag = numpy.asarray(flag, dtype=numpy.intp).reshape(-1, len(self.dims))
+
+		if self.flagged is None:
+			self.flagged = set()
+		elif not self.flags_incremental:
+			self.flagged.clear()
+
+		if len(flag):
+			self.flagged.update(
+				numpy.ravel_multi_index(tuple(flag.T), self.dims).tolist()
+			)
+
+	# Cells along each axis from the start of the board to the given chunk,
+	# and the chunk's size
+	def chunk_bounds(self, chunk):
+		start = tuple(c * l for c, l in zip(chunk, self.chunk_dims))
+		return start, tuple(
+			min(s + l, d) - s
+			for s, l, d in zip(start, self.chunk_dims, self.dims)
+		)
+
+	# The chunk's share of the board's mines: the mines at the board's density
+	# up to the end of the chunk, less those up to its start, counting chunks
+	# in C order
+	def chunk_mine_count(self, chunk):
+		_, shape = self.chunk_bounds(chunk)
+		total_cells = functools.reduce(lambda x,y: x*y, self.dims)
+
+		# Cells of chunks before this one: for each axis, those whose coords
+		# match up to that axis and are lower along it
+		before = 0
+		outer = 1
+		for axis, (c, size) in enumerate(zip(chunk, shape)):
+			before += outer * c * self.chunk_dims[axis] * functools.reduce(
+				lambda x,y: x*y,
+				self.dims[axis + 1:],
+				1
+			)
+			outer *= size
+
+		cells = functools.reduce(lambda x,y: x*y, shape)
+		return (
+			self.mines * (before + cells) // total_cells -
+			self.mines * before // total_cells
+		)
+
+	def chunk_mines(self, chunk):
+		if chunk not in self.chunks:
+			_, shape = self.chunk_bounds(chunk)
+			grid = numpy.zeros(shape, dtype=GRID_DTYPE)
+			place_mines(
+				grid.reshape(-1),
+				self.chunk_mine_count(chunk),
+				numpy.random.default_rng((
+					self.seed,
+					int(numpy.ravel_multi_index(chunk, self.chunk_grid_dims))
+				))
+			)
+			self.chunks[chunk] = grid
+		return self.chunks[chunk]
+
+	# Surrounding mine counts of a chunk's cells, which generates the chunks
+	# around it too
+	def chunk_surr_mine_counts(self, chunk):
+		if chunk not in self.chunk_counts:
+			start, shape = self.chunk_bounds(chunk)
+
+			# The chunk with a border of one cell, where it's on the board
+			region_start = tuple(max(s - 1, 0) for s in start)
+			region_stop = tuple(
+				min(s + l + 1, d) for s, l, d in zip(start, shape, self.dims)
+			)
+			region = numpy.zeros(
+				tuple(b - a for a, b in zip(region_start, region_stop)),
+				dtype=GRID_DTYPE
+			)
+
+			for other in itertools.product(*(
+				range(max(c - 1, 0), min(c + 2, n))
+				for c, n in zip(chunk, self.chunk_grid_dims)
+			)):
+				other_start, other_shape = self.chunk_bounds(other)
+				low = tuple(map(max, other_start, region_start))
+				high = tuple(
+					min(s + l, r)
+					for s, l, r in zip(other_start, other_shape, region_stop)
+				)
+				region[tuple(
+					slice(l - r, h - r)
+					for l, h, r in zip(low, high, region_start)
+				)] = self.chunk_mines(other)[tuple(
+					slice(l - s, h - s)
+					for l, h, s in zip(low, high, other_start)
+				)]
+
+			self.chunk_counts[chunk] = count_surrounding_mines(region)[tuple(
+				slice(s - r, s - r + l)
+				for s, r, l in zip(start, region_start, shape)
+			)]
+		return self.chunk_counts[chunk]
+
+# For benchmark scripts: counts the turns played on it, and finds a zero-cell to
+# start on, so games get somewhere without guessing.
+class CountingServer(PythonInternalServer):
+	turns = 0
+
+	def turn_array(self, *args, **kwargs):
+		self.turns += 1
+		return super().turn_array(*args, **kwargs)
+
+	def zero_cell_coords(self):
+		return tuple(numpy.argwhere(
+			(self.surr_mine_counts == 0) & (self.game_grid == CLEAR)
+		)[0].tolist())
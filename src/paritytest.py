@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+# Check that each flat array client makes the same deductions as the object
+# client it's equivalent to: the same seeded games, started from the same cell,
+# should end with the same result and number of cells left.
+
+from reactive_ai import (
+	ReactiveClient,
+	ReactiveClientCheckShared,
+	PythonInternalServer
+)
+from array_ai import ArrayReactiveClient, ArrayReactiveClientCheckShared
+
+CLIENT_PAIRS = (
+	(ReactiveClient, ArrayReactiveClient),
+	(ReactiveClientCheckShared, ArrayReactiveClientCheckShared)
+)
+
+def play(client, dims, mines, seed):
+	server = PythonInternalServer(dims, mines, seed)
+	client(server, first_coords=0)
+	return server.win, server.cells_rem
+
+def test(client, array_client, dims, mines, seeds):
+	mismatches = [
+		seed for seed in seeds
+		if play(client, dims, mines, seed) !=
+			play(array_client, dims, mines, seed)
+	]
+
+	print("{:<32}{:>12}{:>6} mines{:>6}/{} games differ{}".format(
+		array_client.__name__,
+		"x".join(str(d) for d in dims),
+		mines,
+		len(mismatches),
+		len(seeds),
+		": seeds {}".format(mismatches) if mismatches else ""
+	))
+
+for dims, mines in (
+	((16, 16), 40),
+	((16, 16), 60),
+	((30, 16), 99),
+	((8, 8, 8), 50)
+):
+	for client, array_client in CLIENT_PAIRS:
+		test(client, array_client, dims, mines, range(100))
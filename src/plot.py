@@ -1,24 +1,23 @@
 #!/usr/bin/env python3
-USE_MULTIPROCESS = False
+# Set False to play games on threads in this process instead, e.g. for
+# debugging or profiling
+USE_MULTIPROCESS = True
 
 import sys
 import functools
 import math
-# TODO: sometimes errors using multiprocess due to crappy pickling. Disable
-# in this case.
 if USE_MULTIPROCESS:
-	import multiprocess as multiprocessing
+	import multiprocessing
 else:
 	import multiprocessing.dummy as multiprocessing
-import statistics
-import scipy
-import statsmodels.api as sm
 import numpy as np
-import matplotlib.pyplot as pyplot
 import progressbar # github.com/coagulant/progressbar-python3
 
 from guess_ais import *
 from server_json_wrapper import JSONServerWrapper
+from game_results import ResultStore, config_key, play_games
+from scheduling import CostEstimates, ChunkScheduler, run_scheduled
+from session_metrics import SessionMetrics
 
 REPEATS_PER_CONFIG = 300
 DIMS_LEN = 6
@@ -27,11 +26,27 @@ SEEDS_SEED = 7
 MINES_MIN = 1
 MINES_MAX = (DIMS_LEN ** NUM_DIMS) // 2
 
-# Reduce this when using very slow clients
-POOL_MAX_CHUNKSIZE = 10
+# Set to play each config's games in rounds of ROUND_REPEATS, until the
+# confidence interval of its win rate (as a fraction) is narrower than this, or
+# REPEATS_PER_CONFIG games have been played. None to always play every game.
+WIN_RATE_CI_WIDTH = None
+WIN_RATE_CI_ALPHA = 0.05
+ROUND_REPEATS = 30
 
 SERVER = PythonInternalServer
 
+# Where the throughput and game durations of a run are written at the end; None
+# to not write them
+METRICS_FILE = "metrics.json"
+
+# Where results are kept as they're played; games already in the file aren't
+# played again, unless the client or server code has changed since. None to
+# keep results in memory only.
+RESULTS_FILE = "results.csv"
+# Most results to keep in the file; the oldest are dropped on starting and on
+# finishing, so it can go over this during a session. None for no limit.
+RESULTS_MAX = 2000000
+
 if hasattr(multiprocessing, "cpu_count"):
 	no_cores = multiprocessing.cpu_count()
 else:
@@ -44,22 +59,103 @@ plot_clients = [
 	#("cyan", ReactiveClientGuessAny),
 	("orange", ReactiveClientAvgEmptiesBalanced),
 	#("purple", ReactiveClientExhaustiveTest),
-	#("pink", ReactiveClientExhaustiveSplit),
 ]
 
-# Chunksize for pools as calculated in multiprocessing module, but with the
-# addition of a specified cap. Allows for more frequent progress counter updates
-# on large game sets, with no noticeable performance impact (using the default
-# of 100)
-def get_chunksize(len, cores, max=POOL_MAX_CHUNKSIZE):
-	if len == 0:
-		return 0
+# Progress bar widget showing the throughput of a session
+class MetricsWidget(progressbar.Widget):
+	def __init__(self, metrics):
+		self.metrics = metrics
+
+	def update(self, pbar):
+		return self.metrics.status()
+
+# Play the given game configs of one client on the pool, and return an iterable
+# of a GameResult for each. If given a ResultStore, games already in it are
+# skipped, each new result is added to it as soon as it's played, and the
+# results are read back from it rather than held in memory.
+#
+# Games are handed out to the pool in chunks, longest first by the given
+# CostEstimates, which learn from each game played; each chunk is taken as a
+# worker frees up, so it's scheduled from every result back by then. Each
+# chunk's results are also recorded in the given SessionMetrics as they come
+# back.
+def play_configs(
+	client,
+	configs,
+	pool,
+	store=None,
+	estimates=None,
+	metrics=None
+):
+	keys = set(config_key(c) for c in configs)
+	if store is not None:
+		configs = [c for c in configs if c not in store]
+	if estimates is None:
+		estimates = CostEstimates()
+	if metrics is None:
+		metrics = SessionMetrics()
+
+	played = []
+
+	if configs:
+		results = run_scheduled(
+			pool,
+			play_games,
+			ChunkScheduler(configs, estimates, no_cores)
+		)
+		metrics.start_batch(len(configs))
+
+		# Run w/ progress bar, now we know how many games there are
+		counter = progressbar.ProgressBar(
+			widgets = [
+				progressbar.Timer(format="%s"),
+				" | ",
+				progressbar.SimpleProgress(),
+				" | ",
+				MetricsWidget(metrics),
+				" | " + client.__name__
+			],
+			maxval = len(configs)
+		)
+
+		counter_run = counter.start()
+		count = 0
+		for _, (worker, busy_time, chunk_results) in results:
+			for result in chunk_results:
+				if store is None:
+					played.append(result)
+				else:
+					store.append(result)
+				estimates.add(result)
+			metrics.add_chunk(worker, busy_time, chunk_results)
+			count += len(chunk_results)
+			counter_run.update(count)
+		counter_run.finish()
+
+	if store is None:
+		return played
+
+	return (r for r in store.results(client) if r.key() in keys)
+
+# Width of the confidence interval of a win rate, from a number of games and
+# wins
+def win_rate_ci_width(games, wins, alpha=WIN_RATE_CI_ALPHA):
+	# Slow to import, and only needed in the main process
+	from statsmodels.stats.proportion import proportion_confint
 
-	chunksize, extra = divmod(len, cores * 4)
-	if extra:
-		chunksize += 1
-	return min(max, chunksize)
+	low, high = proportion_confint(wins, games, alpha, method="wilson")
+	return high - low
 
+# Play the games of a session and return an iterable of a GameResult for each,
+# as for play_configs. Uses the given pool if any, so that one pool's workers
+# can be reused between sessions, and likewise for CostEstimates and
+# SessionMetrics.
+#
+# With ci_width set, games are played in rounds of round_repeats games for each
+# config (dims and mine count) at a time, using the same seeds in the same
+# order; a config gets no more rounds once the confidence interval of its win
+# rate is narrower than ci_width. Games are then only spent where the win rate
+# is uncertain, rather than on configs which are nearly always won or lost.
 def play_session(
 	client,
 	repeats_per_config = REPEATS_PER_CONFIG,
@@ -67,7 +163,13 @@ def play_session(
 	mine_count_range = (MINES_MIN, MINES_MAX + 1),
 	cell_mine_ratio_range = None, # Alternative parameter to mine count
 	num_dims_range = (NUM_DIMS, NUM_DIMS + 1),
-	seeds_seed = SEEDS_SEED
+	seeds_seed = SEEDS_SEED,
+	pool = None,
+	store = None,
+	ci_width = WIN_RATE_CI_WIDTH,
+	round_repeats = ROUND_REPEATS,
+	estimates = None,
+	metrics = None
 ):
 	configs = []
 
@@ -96,67 +198,122 @@ def play_session(
 				for seed in seeds:
 					configs.append({
 						"client": client,
+						"server": SERVER,
 						"dims": (dim_length,) * num_dims,
 						"mines": mine_count,
 						"seed" : seed
 					})
 
-	pool = multiprocessing.Pool(no_cores)
-	results = pool.map_async(
-		play_game,
-		configs,
-		chunksize = get_chunksize(len(configs), no_cores)
-	)
-	pool.close()
+	own_pool = pool is None
+	if own_pool:
+		pool = multiprocessing.Pool(no_cores)
+	if estimates is None:
+		estimates = CostEstimates()
+	if metrics is None:
+		metrics = SessionMetrics()
 
-	# Run w/ progress bar, now we know how many games there are
-	counter = progressbar.ProgressBar(
-		widgets = [
-			progressbar.Timer(format="%s"),
-			" | ",
-			progressbar.SimpleProgress(),
-			" | " + client.__name__
-		],
-		maxval = len(results._value)
-	)
+	if ci_width is None:
+		results = play_configs(
+			client,
+			configs,
+			pool,
+			store,
+			estimates,
+			metrics
+		)
+	else:
+		results = play_rounds(
+			client,
+			configs,
+			pool,
+			store,
+			estimates,
+			metrics,
+			ci_width,
+			round_repeats
+		)
+
+	if own_pool:
+		pool.close()
+
+	return results
+
+# Play configs in rounds for play_session
+def play_rounds(
+	client,
+	configs,
+	pool,
+	store,
+	estimates,
+	metrics,
+	ci_width,
+	round_repeats
+):
+	configs_by_game = {}
+	for config in configs:
+		configs_by_game.setdefault(
+			(config["dims"], config["mines"]),
+			[]
+		).append(config)
+
+	counts = { game : (0, 0) for game in configs_by_game }
+	unfinished = list(configs_by_game)
+	played_keys = set()
+	played = []
+
+	while unfinished:
+		round_configs = []
+		for game in unfinished:
+			count = counts[game][0]
+			round_configs += configs_by_game[game][count:count + round_repeats]
+
+		for result in play_configs(
+			client,
+			round_configs,
+			pool,
+			store,
+			estimates,
+			metrics
+		):
+			game = (result.dims, result.mines)
+			count, wins = counts[game]
+			counts[game] = (count + 1, wins + (1 if result.win else 0))
+			if store is None:
+				played.append(result)
+
+		played_keys.update(config_key(c) for c in round_configs)
 
-	counter_run = counter.start()
-	while not results.ready():
-		count = len(results._value) - results._value.count(None)
-		counter_run.update(count)
-		time.sleep(0.5)
-	counter_run.finish()
+		unfinished = [
+			game for game in unfinished
+			if counts[game][0] < len(configs_by_game[game]) and
+				win_rate_ci_width(*counts[game]) >= ci_width
+		]
 
-	return results.get()
+	if store is None:
+		return played
 
-# Returns a dict of lists of games with identical configs
-def group_by_repeats(games):
-	games_by_config = {}
+	return (r for r in store.results(client) if r.key() in played_keys)
+
+# Returns a dict of (games, wins) for each config (dims and mine count), counted
+# as the games are read
+def count_wins_by_config(games):
+	counts_by_config = {}
 	for g in games:
-		key = (tuple(g.server.dims), g.server.mines)
-		if key not in games_by_config:
-			games_by_config[key] = []
-		games_by_config[key].append(g)
-	return games_by_config.values()
+		key = (g.dims, g.mines)
+		count, wins = counts_by_config.get(key, (0, 0))
+		counts_by_config[key] = (count + 1, wins + (1 if g.win else 0))
+	return counts_by_config
 
 def get_fraction_cleared(game):
 	empty_cell_count = (
-		functools.reduce(lambda x,y: x*y, game.server.dims) - game.server.mines
+		functools.reduce(lambda x,y: x*y, game.dims) - game.mines
 	)
-	return (empty_cell_count - game.server.cells_rem) / empty_cell_count
+	return (empty_cell_count - game.cells_rem) / empty_cell_count
 
 if __name__ == "__main__":
-	# Game-running function. Must be non-dynamic, top-level to work with the
-	# pickle library used by multiprocessing.
-	def play_game(config):
-		return config["client"](
-			SERVER(
-				config["dims"],
-				config["mines"],
-				config["seed"]
-			),
-			first_coords=0
-		)
+	# Only needed for plotting, and slow to import; kept out of the module
+	# scope which each worker process imports.
+	import matplotlib.pyplot as pyplot
 
 	# Option to assume games with zero mines would always be won, to save time
 	# actually playing them.
@@ -174,27 +331,48 @@ if __name__ == "__main__":
 
 	(figure, axes) = pyplot.subplots()
 
+	pool = multiprocessing.Pool(no_cores)
+	store = None if RESULTS_FILE is None else ResultStore(
+		RESULTS_FILE,
+		RESULTS_MAX
+	)
+	estimates = CostEstimates(() if store is None else store.results())
+	metrics = SessionMetrics()
+
 	for (colour, client) in plot_clients:
-		games = play_session(client)
+		games = play_session(
+			client,
+			pool=pool,
+			store=store,
+			estimates=estimates,
+			metrics=metrics
+		)
 
 		# No. mines vs % games won
 		plot(
-			group_by_repeats(games),
-			lambda g: g[0].server.mines,
-			lambda g: 100 * statistics.mean(
-				[1 if _g.server.win else 0 for _g in g]
-			),
+			list(count_wins_by_config(games).items()),
+			lambda g: g[0][1],
+			lambda g: 100 * g[1][1] / g[1][0],
 			client.__name__,
 			colour
 		)
 
+	pool.close()
+	if store is not None:
+		store.close()
+
+	print(metrics.summary())
+	if METRICS_FILE is not None:
+		metrics.export(METRICS_FILE)
+
 	# Set graph output settings and render
 	for spine in axes.spines.values():
 		spine.set_visible(False)
 	# TODO: get pyplot.show() working...
 	pyplot.legend()
-	pyplot.title("Mines {} grid, {} games per configuration".format(
+	pyplot.title("Mines {} grid, {}{} games per configuration".format(
 		"{}".format(DIMS_LEN) + "x{}".format(DIMS_LEN) * (NUM_DIMS - 1),
+		"" if WIN_RATE_CI_WIDTH is None else "up to ",
 		REPEATS_PER_CONFIG
 	))
 	pyplot.xlabel('No. mines')
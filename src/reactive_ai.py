@@ -2,16 +2,29 @@
 import random
 import math
 import itertools
+import functools
 import time
 import inspect
 import traceback
 import enum
+import collections
+import array
+import numpy
 
 from server_json_wrapper import JSONServerWrapper
 from internal_server import (
 	PythonInternalServer,
+	ChunkedInternalServer,
+	SURROUNDING_TABLE_MAX_CELLS,
 	get_surrounding_coords,
-	count_empty_cells
+	count_empty_cells,
+	turn_state_names
+)
+from surrounding import (
+	surrounding_table,
+	shared_offsets,
+	shared_exclusive_columns,
+	surrounding_pair_columns
 )
 
 # TODO: command line arg '-v0/-v1' etc with 'argparse' package
@@ -27,6 +40,41 @@ class State(enum.Enum):
 	EMPTY = -3
 	TO_CLEAR = -4
 
+# Client state for each cell state returned by the server
+server_cell_states = {
+	'empty':	State.EMPTY,
+	'cleared':	State.EMPTY,
+	'mine':		State.MINE,
+	'unknown':	State.UNKNOWN
+}
+
+# As above, indexed by the state codes of batched (array) turn results
+server_cell_state_codes = tuple(server_cell_states[n] for n in turn_state_names)
+
+# How much debug info clients send to servers which make use of it
+class DebugLevel(enum.Enum):
+	# No debug info
+	NONE = 0
+	# Only cells whose state or counts changed since the previous turn
+	CHANGED = 1
+	# Every cell, every turn
+	ALL = 2
+
+# Largest board (in cells) for clients which keep arrays over the whole board:
+# those which check shared cells, and the array clients. Larger boards (as from
+# ChunkedInternalServer) can only be played by ReactiveClient and its guessing
+# subclasses, which only make cells as they're reached.
+FULL_BOARD_MAX_CELLS = 2 ** 24
+
+def check_full_board_size(client, dims):
+	size = functools.reduce(lambda x,y: x*y, dims)
+	if size > FULL_BOARD_MAX_CELLS:
+		raise Exception(
+			"{} keeps arrays over the whole board, so can't play boards of "
+			"more than {} cells ({} given); use ReactiveClient or a guessing "
+			"client".format(type(client).__name__, FULL_BOARD_MAX_CELLS, size)
+		)
+
 def log(verbosity, *args, **kwargs):
 	if(VERBOSITY >= verbosity):
 		print(*args, **kwargs)
@@ -58,24 +106,145 @@ class ReactiveClient(object):
 	check_shared = False
 	game_grid = None
 	known_cells = None
+	# Type of each known_cells bucket; anything with CellIndex's add, discard
+	# and iteration will do
+	known_cells_type = None
 	password = "pass"
 	game_over = False
 	win = False
 	turns_hash_sum = 0
+	# Number of turns which cleared a guessed cell
+	guesses = 0
 	start_time = None
 	wait_time = None
 
+	# Whether the server has the batched array turn API
+	server_turn_array = False
+
+	# Deductions waiting to be made, as (function, args) pairs. Cell updates
+	# add to this instead of updating further cells directly, so a cascade of
+	# deductions doesn't recurse.
+	propagation_queue = None
+
+	# Number of deductions made from each turn's new cells
+	propagation_steps = None
+
+	# Sent as ALL to servers which don't take changes only
+	debug_level = DebugLevel.CHANGED
+
+	# Whether to send debug info at all; only if the server uses it.
+	send_debug = False
+
+	# Cells changed since the last turn's debug info was sent; only tracked
+	# for DebugLevel.CHANGED.
+	debug_changed_cells = None
+
+	# Cells flagged since the last turn
+	new_flags = None
+
+	# For check_shared only: the surrounding cell table; copies of each
+	# cell's state and counts by flat index, so that many pairs of cells can
+	# be checked at once (cells outside the grid count as mines); and the
+	# number of unknown cells surrounding each pair of cells, indexed by the
+	# lower cell of the pair and the offset to the other (see shared_offsets).
+	surr_table = None
+	cell_states = None
+	unkn_surr_mine_cnts = None
+	unkn_surr_empt_cnts = None
+	shared_unkn_surr_cnts = None
+
+	# Flat indices of cells which became empty or mines since the shared
+	# counts were last updated
+	shared_changed = None
+
 	# Types of cell to track in reverse-lookup dicts
 	cell_state_lookups = [ State.TO_CLEAR, State.EMPTY, State.MINE ]
 
+	# Whether to keep track of the frontier, for guessing clients
+	track_frontier = False
+
+	# Unknown cells next to at least one empty cell, each mapped to a CellIndex
+	# of its empty surrounding cells; in the order they joined the frontier.
+	frontier = None
+
+	# Whether to keep an UnknownCellIndex, for guessing clients which pick
+	# unknown cells at random
+	track_unknowns = False
+	unknown_cells = None
+
+	# Multipliers for each coord to get a cell's flat index, for clients which
+	# need cells by index (see Cell.index); otherwise None
+	index_strides = None
+
+	# No cell before this flat index is landlocked (unknown, and not on the
+	# frontier). Cells don't become landlocked again once they stop being, so
+	# this only moves forward (unless a cell becomes unknown again).
+	landlocked_cursor = 0
+
 	def __init__(self, server, first_coords=None):
 		self.server = server
+		self.server_turn_array = hasattr(server, "turn_array")
 		self.wait_time = float(0)
 
+		if self.check_shared:
+			check_full_board_size(self, self.server.dims)
+
+		if self.check_shared or self.track_frontier or self.track_unknowns:
+			self.index_strides = tuple(
+				functools.reduce(lambda x,y: x*y, self.server.dims[i + 1:], 1)
+				for i in range(len(self.server.dims))
+			)
+
 		self.game_grid = GameGrid(self)
 
 		# Reverse lookup table for grid
-		self.known_cells = { s : [] for s in self.cell_state_lookups }
+		self.known_cells = {
+			s : (self.known_cells_type or CellIndex)()
+			for s in self.cell_state_lookups
+		}
+		self.new_flags = CellIndex()
+
+		if self.track_frontier:
+			self.frontier = {}
+
+		if self.track_unknowns:
+			self.unknown_cells = UnknownCellIndex(
+				functools.reduce(lambda x,y: x*y, self.server.dims)
+			)
+
+		self.propagation_queue = collections.deque()
+		self.propagation_steps = []
+
+		self.send_debug = (
+			self.server.consumes_debug and
+			self.debug_level != DebugLevel.NONE
+		)
+		if (
+			self.debug_level == DebugLevel.CHANGED and
+			not self.server.debug_changes_only
+		):
+			self.debug_level = DebugLevel.ALL
+		if self.send_debug and self.debug_level == DebugLevel.CHANGED:
+			self.debug_changed_cells = CellIndex()
+
+		if self.check_shared:
+			self.surr_table = surrounding_table(self.server.dims)
+			self.cell_states = numpy.full(
+				self.surr_table.size + 1,
+				State.UNKNOWN.value,
+				dtype=numpy.int8
+			)
+			self.cell_states[-1] = State.MINE.value
+			self.unkn_surr_mine_cnts = numpy.zeros(
+				self.surr_table.size + 1,
+				dtype=numpy.int16
+			)
+			self.unkn_surr_empt_cnts = numpy.zeros_like(
+				self.unkn_surr_mine_cnts
+			)
+			self.unkn_surr_empt_cnts[:-1] = numpy.diff(self.surr_table.indptr)
+			self.shared_unkn_surr_cnts = self.surr_table.shared_counts.copy()
+			self.shared_changed = []
 
 		log(3, "New game: {} (original {}) dims: {} mines: {}".format(
 			self.server.id,
@@ -97,17 +266,43 @@ class ReactiveClient(object):
 	def all_coords(self):
 		return itertools.product(*(range(c) for c in self.server.dims))
 
-	# Debug information about each cell. Read private vars to avoid triggering
-	# any prop-getting behaviour.
-	def game_cells_debug(self):
+	def unknown_count(self):
+		return functools.reduce(lambda x,y: x*y, self.server.dims) - sum(
+			len(self.known_cells[s])
+			for s in (State.TO_CLEAR, State.EMPTY, State.MINE)
+		)
+
+	# The rest need the frontier to be tracked
+	def landlocked_count(self):
+		return self.unknown_count() - len(self.frontier)
+
+	# The first landlocked cell in coords order, or None
+	def first_landlocked_cell(self):
+		by_index = self.game_grid.by_index
+		while self.landlocked_cursor < self.game_grid.size:
+			cell = by_index[self.landlocked_cursor]
+			# Cells with no Cell yet have no empty cells around them
+			if cell is None:
+				return self.game_grid.from_index(self.landlocked_cursor)
+			if cell.state == State.UNKNOWN and cell not in self.frontier:
+				return cell
+			self.landlocked_cursor += 1
+		return None
+
+	# Debug information about each cell, or only the specified cells. Read
+	# private vars to avoid triggering any prop-getting behaviour.
+	def game_cells_debug(self, cells=None):
 		info = {}
 
+		if cells is None:
+			cells = self.game_grid.values()
+
 		# Can't use tuple as JSON key; this matches js-style toString for a
 		# coords array
 		def coords_json_key(coords):
 			return ",".join(str(c) for c in coords)
 
-		for coords, cell in self.game_grid.items():
+		for cell in cells:
 			# Add some private primitives
 			cell_info = {
 				attr : getattr(cell, attr) for attr in [
@@ -124,16 +319,45 @@ class ReactiveClient(object):
 			]
 
 			cell_info["shared_unkn_surr_cnts"] = {
-				coords_json_key(adj_cell.coords) : count
-				for adj_cell, count in cell.shared_unkn_surr_cnts.items()
+				coords_json_key(coords) : count
+				for coords, count in self.shared_counts_debug(cell)
 			}
 
 			# Can't use tuple as JSON key; this matches js-style toString for
 			# a coords array
-			info[coords_json_key(coords)] = cell_info
+			info[coords_json_key(cell.coords)] = cell_info
 
 		return info
 
+	# Coords and shared unknown count of each cell paired with the given cell,
+	# for the pairs where it is the lower cell.
+	def shared_counts_debug(self, cell):
+		if not self.check_shared:
+			return
+
+		dims = self.server.dims
+		for delta, count in zip(
+			shared_offsets(len(dims)),
+			self.shared_unkn_surr_cnts[cell.index].tolist()
+		):
+			coords = tuple(c + d for c, d in zip(cell.coords, delta))
+			if all(0 <= c < dim for c, dim in zip(coords, dims)):
+				yield coords, count
+
+	def turn_debug(self):
+		changes_only = self.debug_level == DebugLevel.CHANGED
+		if changes_only:
+			cells = self.debug_changed_cells
+			self.debug_changed_cells = CellIndex()
+		else:
+			cells = None
+
+		return {
+			"gameInfo" : "game info here",
+			"cellInfo" : self.game_cells_debug(cells),
+			"cellInfoChangesOnly" : changes_only
+		}
+
 	def play(self, first_coords):
 		self.start_time = time.time()
 		if first_coords == None:
@@ -155,27 +379,45 @@ class ReactiveClient(object):
 				raise GameEnd(self, "Out of ideas!")
 
 			log(2, "(?)", end='', flush=True)
+			self.guesses += 1
 			guess_cell.state = State.TO_CLEAR
 
 		to_clear, to_flag = (
-			tuple(c.coords for c in self.known_cells[state])
-			for state in (State.TO_CLEAR, State.MINE)
+			tuple(c.coords for c in cells) for cells in (
+				self.known_cells[State.TO_CLEAR],
+				self.new_flags if self.server.flags_incremental
+					else self.known_cells[State.MINE]
+			)
 		)
+		self.new_flags = CellIndex()
 
 		log(2, "{}".format(len(to_clear)), end='', flush=True)
 
 		self.turns_hash_sum += hash(to_clear)
 
+		turn_args = { "client" : self.__class__.__name__ }
+		if self.send_debug:
+			turn_args["debug"] = self.turn_debug()
+
 		wait_start = time.time()
-		new_cells = self.server.turn(
-			clear=to_clear,
-			flag=to_flag,
-			client=self.__class__.__name__,
-			debug={
-				"gameInfo" : "game info here",
-				"cellInfo" : self.game_cells_debug()
-			}
-		)
+		if self.server_turn_array:
+			new_cells = self.server.turn_array(
+				numpy.array(to_clear, dtype=numpy.intp).reshape(
+					len(to_clear),
+					len(self.server.dims)
+				),
+				numpy.array(to_flag, dtype=numpy.intp).reshape(
+					len(to_flag),
+					len(self.server.dims)
+				),
+				**turn_args
+			)
+		else:
+			new_cells = self.server.turn(
+				clear=to_clear,
+				flag=to_flag,
+				**turn_args
+			)
 		self.wait_time += time.time() - wait_start
 
 		log(2, "->{} ".format(len(new_cells)), end='', flush=True)
@@ -183,16 +425,50 @@ class ReactiveClient(object):
 		if self.server.game_over:
 			raise GameEnd(self)
 
-		for cell_data in new_cells:
-			cell = self.game_grid[tuple(cell_data["coords"])]
-			surr_mine_count = cell_data["surrounding"]
+		if self.server_turn_array:
+			self.update_cells(
+				zip(*(c.tolist() for c in numpy.unravel_index(
+					new_cells["index"],
+					self.server.dims
+				))),
+				new_cells["surrounding"].tolist(),
+				(
+					server_cell_state_codes[s]
+					for s in new_cells["state"].tolist()
+				)
+			)
+		else:
+			self.update_cells(
+				(tuple(c["coords"]) for c in new_cells),
+				(c["surrounding"] for c in new_cells),
+				(server_cell_states[c["state"]] for c in new_cells)
+			)
 
-			cell.state = {
-				'empty':	State.EMPTY,
-				'cleared':	State.EMPTY,
-				'mine':		State.MINE,
-				'unknown':	State.UNKNOWN
-			}[cell_data["state"]]
+		steps = self.propagate()
+		self.propagation_steps.append(steps)
+		log(2, "[{}] ".format(steps), end='', flush=True)
+
+	def queue_deduction(self, fn, *args):
+		self.propagation_queue.append((fn, args))
+
+	# Make queued deductions until there are none left, including any queued
+	# along the way. Returns the number of deductions made.
+	def propagate(self):
+		steps = 0
+		while self.propagation_queue:
+			fn, args = self.propagation_queue.popleft()
+			fn(*args)
+			steps += 1
+		return steps
+
+	def update_cells(self, coords_list, surr_mine_counts, states):
+		for coords, surr_mine_count, state in zip(
+			coords_list,
+			surr_mine_counts,
+			states
+		):
+			cell = self.game_grid[coords]
+			cell.state = state
 
 			# This check avoids unnecessary calculations on zero-cells; can
 			# speed up some games a lot.
@@ -200,51 +476,241 @@ class ReactiveClient(object):
 				cell.unkn_surr_mine_cnt += surr_mine_count
 				cell.unkn_surr_empt_cnt -= surr_mine_count
 
+	# Record a cell becoming empty or a mine, so it's no longer unknown for
+	# each pair of cells around it. The pairs' counts are updated together
+	# for all cells changed before the update comes up in the queue; they're
+	# only read by check_shared_pairs, which only runs after an update, so
+	# they're always exact when read.
+	def queue_shared_update(self, cell):
+		if not self.shared_changed:
+			self.queue_deduction(self.update_shared_counts)
+		self.shared_changed.append(cell.index)
+
+	# Update the counts of each pair of cells around the changed cells, then
+	# recheck every pair of an empty cell which is, or surrounds, a changed
+	# cell with each cell it shares surrounding cells with; the changed cell
+	# may be among the pair's shared cells, or either cell's own.
+	def update_shared_counts(self):
+		dims = self.server.dims
+		num_dims = len(dims)
+		offsets = shared_offsets(num_dims)
+		num_offsets = len(offsets)
+		size = self.surr_table.size
+		changed = numpy.array(self.shared_changed, dtype=numpy.intp)
+		self.shared_changed = []
+
+		low_cols, high_cols, pair_offset_cols = surrounding_pair_columns(
+			num_dims
+		)
+		surr_index = self.surr_table.padded[changed]
+		low = surr_index[:, low_cols].ravel()
+		offset_cols = numpy.tile(pair_offset_cols, len(changed))
+
+		in_grid = (low < size) & (surr_index[:, high_cols].ravel() < size)
+		low, offset_cols = low[in_grid], offset_cols[in_grid]
+		numpy.subtract.at(self.shared_unkn_surr_cnts, (low, offset_cols), 1)
+
+		if self.debug_changed_cells is not None:
+			for index in numpy.unique(low).tolist():
+				self.game_grid.from_index(index).debug_changed()
+
+		# Cells with no unknown surrounding cells left are skipped (see
+		# check_shared_pairs)
+		cells = numpy.unique(numpy.concatenate((changed, surr_index.ravel())))
+		cells = cells[cells < size]
+		mine_cnts = self.unkn_surr_mine_cnts
+		empt_cnts = self.unkn_surr_empt_cnts
+		cells = cells[
+			(self.cell_states[cells] == State.EMPTY.value) &
+			(mine_cnts[cells] + empt_cnts[cells] > 0)
+		]
+
+		coords = numpy.array(
+			numpy.unravel_index(cells, dims)
+		)[..., numpy.newaxis]
+		deltas = numpy.array(offsets).T[:, numpy.newaxis, :]
+		dims_col = numpy.array(dims)[:, numpy.newaxis, numpy.newaxis]
+		steps = self.surr_table.shared_offset_steps
+		pairs = []
+
+		# Pairs with the cell as the lower cell, then as the higher
+		for sign in 1, -1:
+			other = coords + sign * deltas
+			in_grid = ((other >= 0) & (other < dims_col)).all(axis=0)
+			low = cells[:, numpy.newaxis] - (sign < 0) * steps
+			pairs.append(
+				(low * num_offsets + numpy.arange(num_offsets))[in_grid]
+			)
+
+		# Check each pair once, in order of index
+		self.check_shared_pairs(*numpy.divmod(
+			numpy.unique(numpy.concatenate(pairs)),
+			num_offsets
+		))
+
+	# Check each of the given pairs of cells (as lower cell index and
+	# shared_offsets column) which are both empty, with unknown surrounding
+	# cells left; other pairs give nothing the single cell rules don't. The
+	# exclusive surrounding cells of a pair can be set if we're sure one's
+	# exclusive cells must all be mines, and the other's must all be clear
+	# (with the shared cells' states still unknown). That's when one cell's
+	# unknown mines plus the other's unknown empties are no more than their
+	# shared unknown cells: the shared cells can hold at most that many of
+	# each, so they must hold all of both. Every pair is checked at once, from
+	# the counts as they are now; cells set here queue rechecks of the pairs
+	# they affect.
+	def check_shared_pairs(self, low, offset_cols):
+		high = low + self.surr_table.shared_offset_steps[offset_cols]
+		mine_cnts = self.unkn_surr_mine_cnts
+		empt_cnts = self.unkn_surr_empt_cnts
+		both_empty = (
+			(self.cell_states[low] == State.EMPTY.value) &
+			(self.cell_states[high] == State.EMPTY.value) &
+			(mine_cnts[low] + empt_cnts[low] > 0) &
+			(mine_cnts[high] + empt_cnts[high] > 0)
+		)
+		low, high = low[both_empty], high[both_empty]
+		offset_cols = offset_cols[both_empty]
+		mutual_count = self.shared_unkn_surr_cnts[low, offset_cols]
+
+		# Each cell's exclusive cells, and which of those are still unknown
+		columns, valid = shared_exclusive_columns(len(self.server.dims))
+		exclusive = [
+			self.surr_table.padded[
+				index[:, numpy.newaxis],
+				columns[side][offset_cols]
+			]
+			for side, index in enumerate((low, high))
+		]
+		unknown = [
+			(self.cell_states[cells] == State.UNKNOWN.value) &
+			valid[side][offset_cols]
+			for side, cells in enumerate(exclusive)
+		]
+
+		to_clear = []
+		mines = []
+		for cell1, cell2, side1, side2 in (
+			(low, high, 0, 1),
+			(high, low, 1, 0)
+		):
+			saturated = (
+				mine_cnts[cell1] + empt_cnts[cell2] <= mutual_count
+			)[:, numpy.newaxis]
+			to_clear.append(exclusive[side1][saturated & unknown[side1]])
+			mines.append(exclusive[side2][saturated & unknown[side2]])
+
+		mines = numpy.unique(numpy.concatenate(mines))
+		to_clear = numpy.setdiff1d(numpy.concatenate(to_clear), mines)
+		for state, cells in (State.TO_CLEAR, to_clear), (State.MINE, mines):
+			for index in cells.tolist():
+				self.game_grid.from_index(index).state = state
+
 	def get_guess_cell(self):
 		pass
 
 class ReactiveClientCheckShared(ReactiveClient):
 	check_shared = True
 
+# Cells in one state, for the client's reverse lookup table. Iterates in the
+# order cells were added, with O(1) adding, removal and membership checks.
+class CellIndex(dict):
+	def add(self, cell):
+		self[cell] = None
+
+	def discard(self, cell):
+		self.pop(cell, None)
+
+# A dict of flat indices which gives the missing ones as None, for boards too
+# large to list every cell
+class SparseCellList(dict):
+	def __missing__(self, index):
+		return None
+
+# As above, but giving each missing index itself
+class SparseIdentityList(dict):
+	def __missing__(self, index):
+		return index
+
+# Flat indices of the cells still unknown, including those with no Cell yet.
+# The first `count` entries of `indices` are the unknown cells, and
+# `positions` gives each cell's place in it; removal swaps a cell to just past
+# the end, so adding, removal and uniform random choice are all O(1). For
+# large boards, only the entries moved from their starting place are stored.
+class UnknownCellIndex(object):
+	def __init__(self, size):
+		if size > SURROUNDING_TABLE_MAX_CELLS:
+			self.indices = SparseIdentityList()
+			self.positions = SparseIdentityList()
+		else:
+			self.indices = array.array("q", range(size))
+			self.positions = array.array("q", range(size))
+		self.count = size
+
+	def __len__(self):
+		return self.count
+
+	def __iter__(self):
+		return map(self.indices.__getitem__, range(self.count))
+
+	def __contains__(self, index):
+		return self.positions[index] < self.count
+
+	def swap(self, index, pos):
+		other = self.indices[pos]
+		old_pos = self.positions[index]
+		self.indices[pos], self.indices[old_pos] = index, other
+		self.positions[index], self.positions[other] = pos, old_pos
+
+	def add(self, index):
+		if index not in self:
+			self.swap(index, self.count)
+			self.count += 1
+
+	def discard(self, index):
+		if index in self:
+			self.count -= 1
+			self.swap(index, self.count)
+
+	def choice(self):
+		if self.count == 0:
+			return None
+		return self.indices[random.randrange(self.count)]
+
 class GameGrid(dict):
+	# Cells by flat index, as well as by coords, if the client uses flat
+	# indices; None for cells with no Cell yet. Only the cells made are stored
+	# for large boards.
+	by_index = None
+	size = None
+
 	def __init__(self, parent_game):
 		self.parent_game = parent_game
+		self.size = functools.reduce(lambda x,y: x*y, parent_game.server.dims)
+		if parent_game.index_strides is not None:
+			if self.size > SURROUNDING_TABLE_MAX_CELLS:
+				self.by_index = SparseCellList()
+			else:
+				self.by_index = [None] * self.size
 
 	def __getitem__(self, coords):
 		if not coords in self:
-			self.__setitem__(coords, Cell(coords, self.parent_game))
+			cell = Cell(coords, self.parent_game)
+			self.__setitem__(coords, cell)
+			if self.by_index is not None:
+				self.by_index[cell.index] = cell
 		return super().__getitem__(coords)
 
-# The number of unknown cells which surround both of two cells. While this is
-# accessed from dictionaries on either cell, it is only actually stored on one
-# of the two (the other just defers to it).
-class SharedUnknownSurrCounts(dict):
-	def __init__(self, this_cell):
-		self.this_cell = this_cell
-
-	def __setitem__(self, other_cell, val):
-		if id(other_cell) > id(self.this_cell):
-			other_cell.shared_unkn_surr_cnts[self.this_cell] = val
-			return
-		super().__setitem__(other_cell, val)
-		if (
-			self.this_cell.state == State.EMPTY and
-			other_cell.state == State.EMPTY
-		):
-			self.this_cell.check_exclusive_cells_saturated(other_cell)
-
-	def __getitem__(self, other_cell):
-		if id(other_cell) > id(self.this_cell):
-			return other_cell.shared_unkn_surr_cnts[self.this_cell]
-		# Get the value from the other cell if it has it. If not set yet,
-		# count how many cells are shared *total* (no UNKNOWN check), since when
-		# it's first accessed, all involved cells should be unknown.
-		if not other_cell in self:
-			# TODO: figure out formula based on coords values instead of
-			# compared sets; see if it's quicker.
-			val = len(self.this_cell.surr_cells & other_cell.surr_cells)
-			self.__setitem__(other_cell, val)
-		return super().__getitem__(other_cell)
+	def from_index(self, index):
+		cell = self.by_index[index]
+		if cell is None:
+			cell = self[tuple(
+				c.item() for c in numpy.unravel_index(
+					index,
+					self.parent_game.server.dims
+				)
+			)]
+		return cell
 
 class Cell(object):
 	def __init__(self, coords, parent_game):
@@ -255,7 +721,14 @@ class Cell(object):
 		self._surr_cells = None
 		self._unkn_surr_mine_cnt = 0
 		self._unkn_surr_empt_cnt = None
-		self.shared_unkn_surr_cnts = SharedUnknownSurrCounts(self)
+
+		# Flat index, for the client's per-cell arrays; only if the client
+		# needs it
+		self.index = None
+		if parent_game.index_strides is not None:
+			self.index = sum(
+				c * s for c, s in zip(coords, parent_game.index_strides)
+			)
 
 	def __str__(self):
 		return (
@@ -269,6 +742,11 @@ class Cell(object):
 			)
 		)
 
+	def debug_changed(self):
+		changed_cells = self.parent_game.debug_changed_cells
+		if changed_cells is not None:
+			changed_cells.add(self)
+
 	@property
 	def state(self):
 		return self._state
@@ -279,24 +757,53 @@ class Cell(object):
 			return
 
 		known_cells = self.parent_game.known_cells
+		frontier = self.parent_game.frontier
 
-		if self._state in known_cells and self in known_cells[self._state]:
-			known_cells[self._state].remove(self)
+		if self._state in known_cells:
+			known_cells[self._state].discard(self)
 
 		if val in known_cells:
-			known_cells[val].append(self)
+			known_cells[val].add(self)
+
+		# Empty cells stay empty, so cells only leave the frontier by leaving
+		# the unknown state
+		if frontier is not None:
+			if self._state == State.UNKNOWN:
+				frontier.pop(self, None)
+			elif val == State.UNKNOWN:
+				self.join_frontier()
+
+		unknown_cells = self.parent_game.unknown_cells
+		if unknown_cells is not None:
+			if self._state == State.UNKNOWN:
+				unknown_cells.discard(self.index)
+			elif val == State.UNKNOWN:
+				unknown_cells.add(self.index)
+
+		if val == State.UNKNOWN and self.index is not None:
+			self.parent_game.landlocked_cursor = min(
+				self.parent_game.landlocked_cursor,
+				self.index
+			)
 
 		self._state = val
+		self.debug_changed()
+
+		if self.parent_game.check_shared:
+			self.parent_game.cell_states[self.index] = val.value
 
 		if val == State.MINE:
+			self.parent_game.new_flags.add(self)
 			for cell in self.surr_cells:
 				cell.unkn_surr_mine_cnt -= 1
 
 		if val == State.EMPTY:
 			for cell in self.surr_cells:
 				cell.unkn_surr_empt_cnt -= 1
-				if self.parent_game.check_shared:
-					self.check_exclusive_cells_saturated(cell)
+				if frontier is not None and cell._state == State.UNKNOWN:
+					if cell not in frontier:
+						frontier[cell] = CellIndex()
+					frontier[cell].add(self)
 
 		# Update the number of shared unknowns for each pair of surrounding
 		# cells
@@ -304,16 +811,25 @@ class Cell(object):
 			self.parent_game.check_shared and
 			(val == State.EMPTY or val == State.MINE)
 		):
-			for c1, c2 in itertools.combinations(
-				(c for c in self.surr_cells if c.state != State.MINE),
-				2
-			):
-				c1.shared_unkn_surr_cnts[c2] -= 1
-
+			self.parent_game.queue_shared_update(self)
+
+	# Add this cell to the client's frontier if it's next to any empty cells,
+	# on returning to the unknown state.
+	def join_frontier(self):
+		surr_empties = CellIndex()
+		for cell in self.surr_cells:
+			if cell.state == State.EMPTY:
+				surr_empties.add(cell)
+		if surr_empties:
+			self.parent_game.frontier[self] = surr_empties
+
+	# In a fixed order (as get_surrounding_coords gives them), so anything
+	# built by walking them, like the frontier and so guesses, is the same
+	# from run to run
 	@property
 	def surr_cells(self):
 		if self._surr_cells is None:
-			self._surr_cells = frozenset(
+			self._surr_cells = tuple(
 				self.parent_game.game_grid[surr_coords]
 				for surr_coords in get_surrounding_coords(
 					self.coords,
@@ -330,10 +846,14 @@ class Cell(object):
 	@unkn_surr_mine_cnt.setter
 	def unkn_surr_mine_cnt(self, val):
 		if val == 0 and self.state == State.EMPTY:
-			for cell in self.surr_cells:
-				if cell.state == State.UNKNOWN:
-					cell.state = State.TO_CLEAR
+			self.parent_game.queue_deduction(
+				self.set_unknown_surr_cells,
+				State.TO_CLEAR
+			)
 		self._unkn_surr_mine_cnt = val
+		self.debug_changed()
+		if self.parent_game.check_shared:
+			self.parent_game.unkn_surr_mine_cnts[self.index] = val
 
 	@property
 	def unkn_surr_empt_cnt(self):
@@ -344,33 +864,19 @@ class Cell(object):
 	@unkn_surr_empt_cnt.setter
 	def unkn_surr_empt_cnt(self, val):
 		if val == 0:
-			for cell in self.surr_cells:
-				if cell.state == State.UNKNOWN:
-					cell.state = State.MINE
+			self.parent_game.queue_deduction(
+				self.set_unknown_surr_cells,
+				State.MINE
+			)
 		self._unkn_surr_empt_cnt = val
-
-	# The exclusive surrounding cells of two shared cells can be set if
-	# we're sure one's exclusive cells must all be mines, and the other's
-	# must all be clear (with the shared cells' states still unknown).
-	def check_exclusive_cells_saturated(self, other_cell):
-		mutual_count = self.shared_unkn_surr_cnts[other_cell]
-		for (cell1, cell2) in (
-			(self, other_cell),
-			(other_cell, self)
-		):
-			if (
-				cell1.unkn_surr_mine_cnt < mutual_count and
-				cell2.unkn_surr_empt_cnt < mutual_count
-			):
-				new_empties = cell1.surr_cells - cell2.surr_cells
-				new_mines = cell2.surr_cells - cell1.surr_cells
-				for cell in new_empties:
-					if cell.state == State.UNKNOWN:
-						cell.state = State.TO_CLEAR
-				for cell in new_mines:
-					if cell.state == State.UNKNOWN:
-						cell.state = State.MINE
-				return
+		self.debug_changed()
+		if self.parent_game.check_shared:
+			self.parent_game.unkn_surr_empt_cnts[self.index] = val
+
+	def set_unknown_surr_cells(self, state):
+		for cell in self.surr_cells:
+			if cell.state == State.UNKNOWN:
+				cell.state = state
 
 def play_game(dims, mines, repeats=1):
 	played_games = []
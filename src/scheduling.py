@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+import functools
+import queue
+
+# Chunks are sized so that each takes about 1/CHUNKS_PER_WORKER of a worker's
+# share of the estimated time still to go, so they shrink towards the end of a
+# session (guided self-scheduling), and the last games all finish at around the
+# same time.
+CHUNKS_PER_WORKER = 4
+
+# Smallest estimated time per chunk in seconds, so that very short games are
+# still sent in batches large enough to be worth the overhead.
+MIN_CHUNK_TIME = 0.05
+
+# Most games per chunk of configs with no estimate to go on, in case they're
+# slow
+UNKNOWN_CHUNK_GAMES = 10
+
+def cell_count(dims):
+	return functools.reduce(lambda x,y: x*y, dims)
+
+# How long games of each client, dims and mine count take, learned from the
+# results of games already played
+class CostEstimates(object):
+	# (games, total seconds) by (client name, dims, mines)
+	totals = None
+	# (games, total seconds per cell) by client name
+	client_totals = None
+
+	def __init__(self, results=()):
+		self.totals = {}
+		self.client_totals = {}
+		for result in results:
+			self.add(result)
+
+	def add(self, result):
+		duration = result.total_time + result.wait_time
+		key = (result.client, result.dims, result.mines)
+
+		games, seconds = self.totals.get(key, (0, 0))
+		self.totals[key] = (games + 1, seconds + duration)
+
+		games, seconds = self.client_totals.get(result.client, (0, 0))
+		self.client_totals[result.client] = (
+			games + 1,
+			seconds + duration / cell_count(result.dims)
+		)
+
+	# Estimated seconds for a config's game: the mean of past games with the
+	# same client, dims and mines; otherwise of all past games of the client,
+	# scaled by the number of cells; otherwise None.
+	def estimate(self, config):
+		client = config["client"].__name__
+		dims = tuple(int(d) for d in config["dims"])
+
+		games, seconds = self.totals.get(
+			(client, dims, int(config["mines"])),
+			(0, 0)
+		)
+		if games:
+			return seconds / games
+
+		games, seconds = self.client_totals.get(client, (0, 0))
+		if games:
+			return seconds / games * cell_count(dims)
+
+		return None
+
+# Hands out chunks of configs one at a time, most expensive first, so that no
+# long game is left to start at the end of a session while the other workers
+# sit idle. Each chunk is picked and sized from the estimates as they are when
+# it's taken, so results added to them during a session reorder and resize the
+# rest of its chunks. Configs with no estimate yet (say, of a new client) go
+# first, in chunks of up to UNKNOWN_CHUNK_GAMES, so they're learned before the
+# rest are scheduled; for sizing they're assumed to take as long as the mean of
+# those with one, or all the same if none have one. Ties keep their original
+# order.
+class ChunkScheduler(object):
+	def __init__(
+		self,
+		configs,
+		estimates,
+		workers,
+		chunks_per_worker=CHUNKS_PER_WORKER,
+		min_chunk_time=MIN_CHUNK_TIME
+	):
+		self.configs = list(configs)
+		self.estimates = estimates
+		self.workers = workers
+		self.chunks_per_worker = chunks_per_worker
+		self.min_chunk_time = min_chunk_time
+
+	def __len__(self):
+		return len(self.configs)
+
+	# The next chunk of configs, or None once they've all been handed out
+	def next_chunk(self):
+		if not self.configs:
+			return None
+
+		costs = [self.estimates.estimate(c) for c in self.configs]
+		unknown = [c is None for c in costs]
+		known = [c for c in costs if c is not None]
+		default = sum(known) / len(known) if known else 1
+		costs = [default if c is None else c for c in costs]
+
+		order = sorted(
+			range(len(self.configs)),
+			key=lambda i: (unknown[i], costs[i]),
+			reverse=True
+		)
+		target = max(
+			sum(costs) / (self.workers * self.chunks_per_worker),
+			self.min_chunk_time
+		)
+
+		# A chunk of configs with no estimate is kept to those alone, and to at
+		# most UNKNOWN_CHUNK_GAMES of them
+		chunk_unknown = unknown[order[0]]
+		chunk_len = 0
+		chunk_cost = 0
+		while (
+			chunk_len < len(order) and
+			unknown[order[chunk_len]] == chunk_unknown and
+			not (chunk_unknown and chunk_len == UNKNOWN_CHUNK_GAMES)
+		):
+			chunk_cost += costs[order[chunk_len]]
+			chunk_len += 1
+			if chunk_cost >= target:
+				break
+
+		chunk = [self.configs[i] for i in order[:chunk_len]]
+		self.configs = [self.configs[i] for i in order[chunk_len:]]
+		return chunk
+
+# Play each chunk from a ChunkScheduler with fn on a process pool, and yield
+# each chunk with fn's return value as it comes back. Only as many chunks as
+# there are workers, plus one queued for each, are out at once; the next is
+# taken from the scheduler as each comes back, after the caller has dealt with
+# its results (e.g. added them to the scheduler's estimates).
+def run_scheduled(pool, fn, scheduler):
+	done = queue.Queue()
+
+	def submit():
+		chunk = scheduler.next_chunk()
+		if chunk is None:
+			return False
+		pool.apply_async(
+			fn,
+			(chunk,),
+			callback=lambda result: done.put((chunk, result, None)),
+			error_callback=lambda error: done.put((chunk, None, error))
+		)
+		return True
+
+	pending = 0
+	while pending < 2 * scheduler.workers and submit():
+		pending += 1
+
+	while pending:
+		chunk, result, error = done.get()
+		pending -= 1
+		if error is not None:
+			raise error
+		yield chunk, result
+		if submit():
+			pending += 1
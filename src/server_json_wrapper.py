@@ -29,6 +29,19 @@ class JSONServerWrapper(object):
 	# Allows for greater performance if so.
 	clears_zeroes = True
 
+	# Whether the game server does anything with clients' debug info.
+	consumes_debug = True
+
+	# Whether clients may send debug info for only the cells changed since the
+	# previous turn, rather than every cell. The server must support the
+	# "cellInfoChangesOnly" debug field for this.
+	debug_changes_only = False
+
+	# Whether each turn's flags are only those new since the previous turn,
+	# rather than every flag so far. The server must support the
+	# "flagIncremental" turn parameter for this.
+	flags_incremental = False
+
 	dims = None
 	mines = None
 
@@ -36,8 +49,18 @@ class JSONServerWrapper(object):
 	game_over = None
 	win = None
 
-	def __init__(self, dims=None, mines=None, client=None, reload_id=None):
+	def __init__(
+		self,
+		dims=None,
+		mines=None,
+		client=None,
+		reload_id=None,
+		flags_incremental=False,
+		debug_changes_only=False
+	):
 		self.reload_id = reload_id
+		self.flags_incremental = flags_incremental
+		self.debug_changes_only = debug_changes_only
 
 		if(dims is not None and mines is not None):
 			resp = self.action("new", {
@@ -58,12 +81,17 @@ class JSONServerWrapper(object):
 		self.mines = resp["mines"]
 
 	def turn(self, clear=[], flag=[], client=None, debug=None):
-		return self.action("turn", {
+		params = {
 			"clear": clear,
 			"flag": flag,
 			"client": client,
 			"debug": debug
-		})["clearActual"]
+		}
+
+		if self.flags_incremental:
+			params["flagIncremental"] = True
+
+		return self.action("turn", params)["clearActual"]
 
 	def action(self, action, params):
 		params["id"] = self.id
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+import time
+import json
+import numpy
+
+PERCENTILES = (50, 90, 99)
+
+# Throughput of a running session, gathered from each chunk of games as it
+# comes back from the pool: games per second, how busy each worker has been,
+# game durations by client and by client and mine count, and an ETA for the
+# games dispatched so far. Can be read at any point with snapshot(), and written
+# out with export().
+class SessionMetrics(object):
+	start_time = None
+	games = 0
+
+	# Games dispatched and finished as of the start of the current batch, and
+	# when it started; for the ETA
+	expected = 0
+	batch_start_time = None
+	batch_start_games = 0
+
+	# Seconds spent playing games by worker process id
+	worker_busy = None
+
+	# Game durations in seconds by client name, and by mine count for each
+	# client
+	durations = None
+	durations_by_mines = None
+
+	def __init__(self):
+		self.start_time = time.time()
+		self.worker_busy = {}
+		self.durations = {}
+		self.durations_by_mines = {}
+
+	# Note that the given number of games have been dispatched
+	def start_batch(self, games):
+		self.batch_start_time = time.time()
+		self.batch_start_games = self.games
+		self.expected = self.games + games
+
+	# Record a chunk of results, as returned by game_results.play_games
+	def add_chunk(self, worker, busy_time, results):
+		self.worker_busy[worker] = self.worker_busy.get(worker, 0) + busy_time
+		self.games += len(results)
+
+		for result in results:
+			duration = result.total_time + result.wait_time
+			self.durations.setdefault(result.client, []).append(duration)
+			self.durations_by_mines.setdefault(
+				result.client,
+				{}
+			).setdefault(result.mines, []).append(duration)
+
+	def elapsed(self):
+		return time.time() - self.start_time
+
+	def games_per_second(self):
+		elapsed = self.elapsed()
+		return self.games / elapsed if elapsed > 0 else 0
+
+	# Seconds until the games dispatched so far are done, at the rate of the
+	# current batch; None until there's a rate to go on
+	def eta(self):
+		if self.batch_start_time is None:
+			return None
+
+		done = self.games - self.batch_start_games
+		elapsed = time.time() - self.batch_start_time
+		if done == 0 or elapsed <= 0:
+			return None
+		return (self.expected - self.games) * elapsed / done
+
+	# Fraction of the time since starting which each worker spent playing
+	# games
+	def worker_utilisation(self):
+		elapsed = self.elapsed()
+		return {
+			worker : min(busy / elapsed, 1) if elapsed > 0 else 0
+			for worker, busy in self.worker_busy.items()
+		}
+
+	# Percentiles of the game durations by client, and by client and mine
+	# count
+	def latencies(self):
+		return (
+			{
+				client : duration_stats(durations)
+				for client, durations in self.durations.items()
+			},
+			{
+				client : {
+					mines : duration_stats(durations)
+					for mines, durations in sorted(by_mines.items())
+				}
+				for client, by_mines in self.durations_by_mines.items()
+			}
+		)
+
+	# One line of the current state, for showing progress
+	def status(self):
+		eta = self.eta()
+		utilisation = self.worker_utilisation()
+
+		return "{:.1f} games/s | {} workers {:.0%} busy | ETA {}".format(
+			self.games_per_second(),
+			len(utilisation),
+			(
+				sum(utilisation.values()) / len(utilisation)
+				if utilisation else 0
+			),
+			"--" if eta is None else "{:.0f}s".format(eta)
+		)
+
+	def snapshot(self):
+		by_client, by_mines = self.latencies()
+		return {
+			"elapsed" : self.elapsed(),
+			"games" : self.games,
+			"games_per_second" : self.games_per_second(),
+			"eta" : self.eta(),
+			"worker_utilisation" : {
+				str(worker) : utilisation
+				for worker, utilisation in self.worker_utilisation().items()
+			},
+			"latency" : by_client,
+			"latency_by_mines" : {
+				client : {
+					str(mines) : stats for mines, stats in stats_by_mines.items()
+				}
+				for client, stats_by_mines in by_mines.items()
+			}
+		}
+
+	def summary(self):
+		by_client, _ = self.latencies()
+		lines = ["{} games in {:.1f}s; {}".format(
+			self.games,
+			self.elapsed(),
+			self.status()
+		)]
+		for client, stats in sorted(by_client.items()):
+			lines.append("{:<40}{}".format(client, " ".join(
+				"p{}={:.4f}s".format(p, stats["p{}".format(p)])
+				for p in PERCENTILES
+			)))
+		return "\n".join(lines)
+
+	def export(self, path):
+		with open(path, "w") as f:
+			json.dump(self.snapshot(), f, indent="\t")
+
+# Number of games, mean, max and PERCENTILES of some game durations
+def duration_stats(durations):
+	stats = {
+		"games" : len(durations),
+		"mean" : float(numpy.mean(durations)),
+		"max" : float(numpy.max(durations))
+	}
+	for p, value in zip(PERCENTILES, numpy.percentile(durations, PERCENTILES)):
+		stats["p{}".format(p)] = float(value)
+	return stats
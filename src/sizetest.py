@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+# Show how ReactiveClient turn time grows with board size, at a fixed mine
+# density; against a baseline keeping known cells in plain lists, as it used
+# to, where each state change scans and removes from a list.
+
+import numpy
+
+from reactive_ai import ReactiveClient
+from internal_server import CountingServer
+
+MINE_DENSITY = 0.03
+
+class CellList(list):
+	def add(self, cell):
+		self.append(cell)
+
+	def discard(self, cell):
+		if cell in self:
+			self.remove(cell)
+
+class ListReactiveClient(ReactiveClient):
+	known_cells_type = CellList
+
+def test(client, dims, seed):
+	mines = int(MINE_DENSITY * numpy.prod(dims))
+	numpy.random.seed(seed)
+	server = CountingServer(dims, mines)
+
+	game = client(server, first_coords=server.zero_cell_coords())
+
+	print("{:<24}{:>12}{:>6} turns{:>10.3f}ms/turn{:>10.3f}s total".format(
+		client.__name__,
+		"x".join(str(d) for d in dims),
+		server.turns,
+		1000 * game.total_time / server.turns,
+		game.total_time
+	))
+
+for dim_length in (50, 100, 150, 200):
+	for client in ListReactiveClient, ReactiveClient:
+		test(client, (dim_length, dim_length), 1)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+import itertools
+import functools
+import numpy
+
+# Lookup tables of each cell's surrounding cells, built once per grid shape and
+# shared between all games (and clients/servers) of that shape. Cells are
+# identified by flat index, as given by numpy.ravel_multi_index.
+
+# Number of grid shapes to keep tables for
+TABLE_CACHE_SIZE = 16
+
+# Largest grid (in cells) whose table is kept for sharing; a table takes around
+# 70 bytes per cell, so larger ones are only kept by the game using them
+TABLE_CACHE_MAX_CELLS = 2 ** 18
+
+# Offsets of a cell's surrounding cells, in the same order as
+# get_surrounding_coords
+def surrounding_offsets(num_dims):
+	return [
+		offset for offset in itertools.product((-1, 0, 1), repeat=num_dims)
+		if any(offset)
+	]
+
+# Flat index of each surrounding cell for every cell in the grid; row i holds
+# the surrounding cells of cell i. Offsets which fall outside the grid are
+# given the index `size` (one past the last cell).
+def padded_surrounding_index(dims):
+	size = functools.reduce(lambda x,y: x*y, dims)
+	coords = numpy.indices(dims).reshape(len(dims), size)
+	offsets = surrounding_offsets(len(dims))
+
+	table = numpy.empty(
+		(size, len(offsets)),
+		dtype=numpy.int32 if size < 2 ** 31 else numpy.int64
+	)
+
+	for col, offset in enumerate(offsets):
+		surr_coords = coords + numpy.array(offset)[:, numpy.newaxis]
+		valid = (
+			(surr_coords >= 0) &
+			(surr_coords < numpy.array(dims)[:, numpy.newaxis])
+		).all(axis=0)
+		table[:, col] = numpy.where(
+			valid,
+			numpy.ravel_multi_index(surr_coords, dims, mode="clip"),
+			size
+		)
+
+	return table
+
+# For every other cell b which shares surrounding cells with a cell a (any
+# nonzero offset of at most 2 in each dimension): the offset from a to b, and
+# which columns of the surrounding index table give the cells surrounding both
+# a and b (from a's row), only a (from a's row) and only b (from b's row). The
+# exclusive cells don't include a or b themselves.
+@functools.lru_cache(maxsize=None)
+def shared_surrounding_columns(num_dims):
+	offsets = surrounding_offsets(num_dims)
+	surr = set(offsets)
+	ret = []
+
+	for delta in itertools.product(range(-2, 3), repeat=num_dims):
+		if not any(delta):
+			continue
+
+		# Each of a's surrounding offsets relative to b, and each of b's
+		# surrounding offsets relative to a
+		from_b = [
+			tuple(o - d for o, d in zip(offset, delta)) for offset in offsets
+		]
+		from_a = [
+			tuple(o + d for o, d in zip(offset, delta)) for offset in offsets
+		]
+
+		ret.append((
+			numpy.array(delta),
+			[col for col, o in enumerate(from_b) if o in surr],
+			[
+				col for col, o in enumerate(from_b)
+				if o not in surr and offsets[col] != delta
+			],
+			[col for col, o in enumerate(from_a) if o not in surr and any(o)]
+		))
+
+	return ret
+
+# For each of shared_offsets, the surrounding index table columns of the cells
+# surrounding only the lower cell of the pair (from its row), then of those
+# surrounding only the higher cell (from its row), padded to the same width;
+# and which columns are real, not padding. Each is (2, offsets, width).
+@functools.lru_cache(maxsize=None)
+def shared_exclusive_columns(num_dims):
+	exclusive = {
+		tuple(delta.tolist()) : (a_only, b_only)
+		for delta, _, a_only, b_only in shared_surrounding_columns(num_dims)
+	}
+	offsets = shared_offsets(num_dims)
+	width = max(len(cols) for d in offsets for cols in exclusive[d])
+
+	columns = numpy.zeros((2, len(offsets), width), dtype=numpy.intp)
+	valid = numpy.zeros((2, len(offsets), width), dtype=bool)
+	for i, delta in enumerate(offsets):
+		for side, cols in enumerate(exclusive[delta]):
+			columns[side, i, :len(cols)] = cols
+			valid[side, i, :len(cols)] = True
+
+	return columns, valid
+
+# Offsets from a cell a to each other cell b which shares surrounding cells
+# with it, keeping only one of each +/- pair (the lexicographically positive
+# one). Since the positive offset leads to the higher flat index, a pair of
+# cells is identified by the lower cell's index and a column of this list.
+@functools.lru_cache(maxsize=None)
+def shared_offsets(num_dims):
+	return [
+		delta for delta in itertools.product(range(-2, 3), repeat=num_dims)
+		if delta > (0,) * num_dims
+	]
+
+# Each pair of cells surrounding some cell c, as surrounding index table
+# columns (from c's row) for the lower and higher cell of the pair, and the
+# shared_offsets column of the offset between them.
+@functools.lru_cache(maxsize=None)
+def surrounding_pair_columns(num_dims):
+	offsets = surrounding_offsets(num_dims)
+	offset_cols = { delta : col for col, delta in enumerate(
+		shared_offsets(num_dims)
+	)}
+	low_cols, high_cols, pair_offset_cols = [], [], []
+
+	for col1, col2 in itertools.combinations(range(len(offsets)), 2):
+		# Surrounding offsets are in lexicographic order, so col2 is higher
+		low_cols.append(col1)
+		high_cols.append(col2)
+		pair_offset_cols.append(offset_cols[tuple(
+			o2 - o1 for o1, o2 in zip(offsets[col1], offsets[col2])
+		)])
+
+	return tuple(
+		numpy.array(cols, dtype=numpy.intp)
+		for cols in (low_cols, high_cols, pair_offset_cols)
+	)
+
+# The number of cells surrounding both cells of each pair, for each cell in the
+# grid and each of its shared_offsets; zero where the other cell is outside the
+# grid. The surrounding cells of a cell lie in a box of width 3 around it, so
+# the shared cells are the overlap of two boxes, less the two cells themselves
+# if they are adjacent.
+def shared_surrounding_counts(dims):
+	size = functools.reduce(lambda x,y: x*y, dims)
+	coords = numpy.indices(dims).reshape(len(dims), size)
+	dims_col = numpy.array(dims)[:, numpy.newaxis]
+	offsets = shared_offsets(len(dims))
+
+	counts = numpy.empty((size, len(offsets)), dtype=numpy.int16)
+
+	for col, delta in enumerate(offsets):
+		other_coords = coords + numpy.array(delta)[:, numpy.newaxis]
+		low = numpy.maximum(numpy.maximum(coords, other_coords) - 1, 0)
+		high = numpy.minimum(
+			numpy.minimum(coords, other_coords) + 1,
+			dims_col - 1
+		)
+		overlap = numpy.maximum(high - low + 1, 0).prod(axis=0)
+		if max(abs(d) for d in delta) == 1:
+			overlap -= 2
+
+		valid = (
+			(other_coords >= 0) & (other_coords < dims_col)
+		).all(axis=0)
+		counts[:, col] = numpy.where(valid, overlap, 0)
+
+	return counts
+
+class SurroundingTable(object):
+	dims = None
+	size = None
+
+	# (size, 3^d - 1) array of surrounding cell indices; see
+	# padded_surrounding_index.
+	padded = None
+
+	# CSR-style adjacency: the cells surrounding cell i are
+	# indices[indptr[i]:indptr[i + 1]].
+	indptr = None
+	indices = None
+
+	# Column of each of shared_offsets, by offset; and the difference in flat
+	# index for each, for pairs within the grid
+	shared_offset_cols = None
+	shared_offset_steps = None
+
+	# See shared_surrounding_counts; built when first needed. Copy before
+	# modifying.
+	_shared_counts = None
+
+	def __init__(self, dims):
+		self.dims = dims
+		self.size = functools.reduce(lambda x,y: x*y, dims)
+		self.padded = padded_surrounding_index(dims)
+
+		valid = self.padded < self.size
+		self.indptr = numpy.zeros(self.size + 1, dtype=numpy.intp)
+		numpy.cumsum(numpy.count_nonzero(valid, axis=1), out=self.indptr[1:])
+		self.indices = self.padded[valid]
+
+		self.shared_offset_cols = {
+			delta : col
+			for col, delta in enumerate(shared_offsets(len(dims)))
+		}
+		strides = numpy.cumprod((1,) + tuple(dims[:0:-1]))[::-1]
+		self.shared_offset_steps = numpy.array(
+			shared_offsets(len(dims)),
+			dtype=numpy.intp
+		) @ strides
+
+	@property
+	def shared_counts(self):
+		if self._shared_counts is None:
+			self._shared_counts = shared_surrounding_counts(self.dims)
+		return self._shared_counts
+
+	def surrounding_index(self, index):
+		return self.indices[self.indptr[index]:self.indptr[index + 1]]
+
+	# Not memoised here, as the table outlives the games using it; clients
+	# keep each cell's surrounding cells themselves
+	def surrounding_coords(self, coords):
+		return tuple(zip(*(
+			c.tolist() for c in numpy.unravel_index(
+				self.surrounding_index(
+					numpy.ravel_multi_index(coords, self.dims)
+				),
+				self.dims
+			)
+		)))
+
+@functools.lru_cache(maxsize=TABLE_CACHE_SIZE)
+def cached_surrounding_table(dims):
+	return SurroundingTable(dims)
+
+# Table for a grid shape; shared if it's small enough, otherwise a new one
+def surrounding_table(dims):
+	dims = tuple(dims)
+	if functools.reduce(lambda x,y: x*y, dims) > TABLE_CACHE_MAX_CELLS:
+		return SurroundingTable(dims)
+	return cached_surrounding_table(dims)